@@ -0,0 +1,290 @@
+"""
+Проверка правила входа на истории из хранилища свечей (candle_store.py).
+
+Две реализации одного и того же правила:
+    replay - по каждой свече строит кадр, как его видит живой бот
+             (последние свечи истории с MACD), и вызывает сам
+             check_entry_signal(); медленно, зато это эталон;
+    vector - находит все пересечения нуля за один проход и проверяет их
+             пачкой через vector_engine.find_signals().
+MACD считается один раз по каждому непрерывному участку истории символа
+(как в режиме CandleBuffer - без переходного процесса от старта каждого
+окна); на пропусках в хранилище (бот был остановлен) история делится,
+как в CandleBuffer.load().
+
+Перебор параметров (--fast, --lookback, --min-diff, ... - списки через
+запятую) идет в пуле процессов: каждый процесс открывает файлы хранилища
+через np.memmap, так что свечи в памяти не копируются и общие для всех
+процессов (страничный кэш ОС). MACD для одного набора fast/slow/signal
+считается один раз на символ для всех остальных вариантов правила.
+
+По каждому набору параметров: число пересечений, кандидатов и входов,
+доля входов с ростом цены и средняя/медианная доходность через
+--horizons свечей после закрытия свечи сигнала (цена входа - ее close;
+свеча выхода ищется по времени, вход без нее в хранилище не учитывается).
+
+Примеры:
+    python backtest.py --days 180
+    python backtest.py --days 180 --min-diff 2,3,4 --lookback 30,50 --processes 8 --json sweep.json
+    python backtest.py --symbols BTCUSDT,ETHUSDT --days 30 --replay
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+
+import config
+from candle_buffer import COLUMNS
+from candle_store import CandleStore
+from main import check_entry_signal
+from timeframes import interval_ms
+from vector_engine import find_signals
+
+RULE_DEFAULTS = {'fast': 12, 'slow': 26, 'signal': 9, 'recent': 10, 'lookback': 50, 'guard': 50,
+                 'min_price_diff': 3.0}
+MACD_KEYS = ('fast', 'slow', 'signal')
+
+
+def rule_key(rule):
+    return tuple(rule[k] for k in RULE_DEFAULTS)
+
+
+def make_grid(**values):
+    """{параметр: [значения]} -> список правил (все сочетания), недостающее - по умолчанию."""
+    keys = list(RULE_DEFAULTS)
+    lists = [values.get(k) or [RULE_DEFAULTS[k]] for k in keys]
+    return [dict(zip(keys, combo)) for combo in itertools.product(*lists)]
+
+
+EPOCH = pd.Timestamp(0, tz='UTC')
+
+
+def segments(ts, step):
+    """Границы [начало, конец) участков истории без пропусков свечей."""
+    breaks = np.flatnonzero(np.diff(ts) != step) + 1
+    bounds = np.r_[0, breaks, len(ts)]
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def macd_frame(columns, fast=12, slow=26, signal=9):
+    """Колонки свечей (CandleStore.read) -> DataFrame с MACD, как в get_historical_data()."""
+    df = pd.DataFrame({c: columns[c] for c in ('open', 'high', 'low', 'close', 'volume', 'turnover')},
+                      index=pd.to_datetime(np.asarray(columns['timestamp']), unit='ms', utc=True))
+    df.index.name = 'timestamp'
+    df.ta.macd(close='close', fast=fast, slow=slow, signal=signal, append=True)
+    df.dropna(inplace=True)
+    df.index = df.index.tz_convert('Asia/Yekaterinburg')
+    return df
+
+
+def frame_length(rule, history):
+    """Сколько строк в кадре живого бота: history свечей минус прогрев MACD."""
+    return history - (rule['slow'] + rule['signal'] - 2)
+
+
+def replay_entries(symbol, df, rule, history):
+    """Номера строк свечей сигнала - check_entry_signal() на каждом шаге истории."""
+    window = frame_length(rule, history)
+    entries = []
+    # k - незакрытая свеча кадра, сигнал - по свече k - 1
+    for k in range(1, len(df)):
+        frame = df.iloc[max(0, k - window + 1):k + 1]
+        if check_entry_signal(frame, symbol, **rule):
+            entries.append(k - 1)
+    return np.array(entries, dtype=np.int64), None
+
+
+def vector_entries(symbol, df, rule, history):
+    """
+    То же, что replay_entries(), за один проход: каждое пересечение нуля
+    превращается в строку матрицы с хвостом его кадра, и все строки
+    проверяются одним вызовом find_signals(). Возвращает (строки входов,
+    {стадия: число пересечений}).
+    """
+    hist = df[f"MACDh_{rule['fast']}_{rule['slow']}_{rule['signal']}"].to_numpy(dtype=np.float64)
+    low = df['low'].to_numpy(dtype=np.float64)
+    window = frame_length(rule, history)
+    k = np.flatnonzero((hist[:-1] < 0) & (hist[1:] > 0)) + 2
+    k = k[k < len(hist)]
+    stages = {}
+    if not len(k):
+        return np.empty(0, dtype=np.int64), stages
+    # Нужен только хвост кадра: пересечение, свеча 1 и lookback свечей перед ней
+    width = rule['recent'] + rule['lookback'] + 2
+    lengths = np.minimum(window, k + 1)
+    positions = k[:, None] - width + 1 + np.arange(width)
+    outside = positions < (k - lengths + 1)[:, None]
+    positions = np.clip(positions, 0, None)
+    hist_w = np.where(outside, np.nan, hist[positions])
+    low_w = np.where(outside, np.nan, low[positions])
+    results = find_signals(list(range(len(k))), low_w, hist_w, lengths,
+                           recent=rule['recent'], lookback=rule['lookback'], guard=rule['guard'],
+                           min_price_diff=rule['min_price_diff'], min_bars=rule['guard'] + rule['recent'] + 1)
+    for r in results:
+        stages[r['stage']] = stages.get(r['stage'], 0) + 1
+    entries = np.array([k[r['symbol']] - 1 for r in results if r['entry']], dtype=np.int64)
+    return entries, stages
+
+
+def forward_returns(ts, close, entry_ts, horizons, step):
+    """
+    {h: доходности, %, через h свечей после входа}. ts/close - вся история
+    символа, entry_ts - время свечей сигнала. Свеча выхода ищется по
+    времени; если ее нет (конец истории или пропуск), вход пропускается.
+    """
+    entry = np.searchsorted(ts, entry_ts)
+    result = {}
+    for h in horizons:
+        target = entry_ts + h * step
+        exit_ = np.minimum(np.searchsorted(ts, target), len(ts) - 1)
+        valid = ts[exit_] == target
+        result[h] = (close[exit_[valid]] / close[entry[valid]] - 1) * 100
+    return result
+
+
+def run_chunk(root, interval, symbols, limit, rules, horizons, history, replay=False):
+    """
+    Задача процесса пула: все правила по части символов.
+    Возвращает {ключ правила: частичная статистика}.
+    """
+    store = CandleStore(root)
+    evaluate = replay_entries if replay else vector_entries
+    stats = {rule_key(rule): {'symbols': 0, 'bars': 0, 'stages': {}, 'entries': 0,
+                              'returns': {h: [] for h in horizons}} for rule in rules}
+    by_macd = {}
+    for rule in rules:
+        by_macd.setdefault(tuple(rule[k] for k in MACD_KEYS), []).append(rule)
+    step = interval_ms(interval)
+    for symbol in symbols:
+        columns = store.read(symbol, interval, limit)
+        ts = np.asarray(columns['timestamp'])
+        close = np.asarray(columns['close'])
+        # Участки короче запроса живого бота не проверяем - он бы их не увидел
+        parts = [(a, b) for a, b in segments(ts, step) if b - a >= history]
+        if not parts:
+            continue
+        for macd_params, macd_rules in by_macd.items():
+            frames = [macd_frame({c: columns[c][a:b] for c in COLUMNS}, *macd_params) for a, b in parts]
+            for rule in macd_rules:
+                s = stats[rule_key(rule)]
+                s['symbols'] += 1
+                for df in frames:
+                    entries, stages = evaluate(symbol, df, rule, history)
+                    s['bars'] += len(df)
+                    for stage, n in (stages or {}).items():
+                        s['stages'][stage] = s['stages'].get(stage, 0) + n
+                    s['entries'] += len(entries)
+                    entry_ts = ((df.index[entries] - EPOCH) // pd.Timedelta(milliseconds=1)).to_numpy(dtype=np.int64)
+                    for h, values in forward_returns(ts, close, entry_ts, horizons, step).items():
+                        s['returns'][h].append(values)
+    for s in stats.values():
+        s['returns'] = {h: np.concatenate(v) if v else np.empty(0) for h, v in s['returns'].items()}
+    return stats
+
+
+def merge(total, part):
+    for key, s in part.items():
+        t = total.setdefault(key, {'symbols': 0, 'bars': 0, 'stages': {}, 'entries': 0, 'returns': {}})
+        t['symbols'] += s['symbols']
+        t['bars'] += s['bars']
+        t['entries'] += s['entries']
+        for stage, n in s['stages'].items():
+            t['stages'][stage] = t['stages'].get(stage, 0) + n
+        for h, values in s['returns'].items():
+            t['returns'][h] = np.concatenate([t['returns'].get(h, np.empty(0)), values])
+    return total
+
+
+def summarize(rules, stats, horizons):
+    rows = []
+    for rule in rules:
+        s = stats.get(rule_key(rule))
+        if s is None:
+            continue
+        row = dict(rule, symbols=s['symbols'], bars=s['bars'], entries=s['entries'],
+                   crossings=sum(s['stages'].values()), candidates=s['stages'].get('candidate', 0))
+        for h in horizons:
+            values = s['returns'].get(h, np.empty(0))
+            row[f'hit_{h}'] = round(float((values > 0).mean()), 4) if len(values) else None
+            row[f'mean_{h}'] = round(float(values.mean()), 4) if len(values) else None
+            row[f'median_{h}'] = round(float(np.median(values)), 4) if len(values) else None
+        rows.append(row)
+    return rows
+
+
+def sweep(root, interval, symbols, limit, rules, horizons, history, processes=None, chunk=8, replay=False):
+    """Все правила по всем символам в пуле процессов. Возвращает строки отчета."""
+    chunks = [symbols[i:i + chunk] for i in range(0, len(symbols), chunk)]
+    stats = {}
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(run_chunk, root, interval, part, limit, rules, horizons, history, replay)
+                   for part in chunks]
+        for future in futures:
+            merge(stats, future.result())
+    return summarize(rules, stats, horizons)
+
+
+def _list(cast):
+    return lambda text: [cast(x) for x in text.split(',') if x]
+
+
+def print_report(rows, horizons):
+    names = [k for k in RULE_DEFAULTS] + ['crossings', 'candidates', 'entries']
+    for h in horizons:
+        names += [f'hit_{h}', f'mean_{h}']
+    widths = [max(10, len(n)) for n in names]
+    print(' '.join(f"{n:>{w}}" for n, w in zip(names, widths)))
+    for row in rows:
+        print(' '.join(f"{'-' if row[n] is None else row[n]:>{w}}" for n, w in zip(names, widths)))
+
+
+def main_backtest(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--store', default=config.CANDLE_STORE_DIR, help='каталог хранилища свечей')
+    parser.add_argument('--interval', default='5')
+    parser.add_argument('--symbols', type=_list(str), default=None, help='через запятую; по умолчанию - все из хранилища')
+    parser.add_argument('--days', type=float, default=None, help='сколько последних суток истории; по умолчанию - вся')
+    parser.add_argument('--history', type=int, default=config.CANDLE_HISTORY,
+                        help='свечей в запросе живого бота (длина кадра)')
+    parser.add_argument('--horizons', type=_list(int), default=[12, 48, 288], help='свечей до оценки доходности')
+    parser.add_argument('--fast', type=_list(int))
+    parser.add_argument('--slow', type=_list(int))
+    parser.add_argument('--signal', type=_list(int))
+    parser.add_argument('--recent', type=_list(int))
+    parser.add_argument('--lookback', type=_list(int))
+    parser.add_argument('--guard', type=_list(int))
+    parser.add_argument('--min-diff', type=_list(float), dest='min_price_diff')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--replay', action='store_true', help='свеча за свечой через check_entry_signal() (медленно, без счетчиков пересечений и кандидатов)')
+    parser.add_argument('--json', help='сохранить отчет в этот файл')
+    args = parser.parse_args(argv)
+
+    store = CandleStore(args.store)
+    symbols = args.symbols or [s for s, interval in store.keys() if interval == str(args.interval)]
+    if not symbols:
+        print(f"В {args.store} нет свечей интервала {args.interval}.")
+        return 1
+    limit = int(args.days * 1440 / int(args.interval)) if args.days else None
+    rules = make_grid(fast=args.fast, slow=args.slow, signal=args.signal, recent=args.recent,
+                      lookback=args.lookback, guard=args.guard, min_price_diff=args.min_price_diff)
+
+    started = time.perf_counter()
+    rows = sweep(args.store, args.interval, symbols, limit, rules, args.horizons, args.history,
+                 processes=args.processes, replay=args.replay)
+    print(f"{len(rules)} наборов параметров x {len(symbols)} символов за {time.perf_counter() - started:.1f} сек")
+    print_report(rows, args.horizons)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_backtest())
@@ -0,0 +1,187 @@
+"""
+Офлайн-бенчмарк прохода сканера против локального fake_bybit.
+
+Измеряет символов/сек, время прохода, p50/p99 времени на символ и пиковую
+память для полного пути (get_historical_data) и инкрементального
+(get_buffered_data). Часы fake_bybit перед каждым проходом сдвигаются
+на одну свечу, как между циклами бота. С --baseline сравнивает результат с сохраненным и
+завершается с кодом 1, если что-то ухудшилось больше чем на --threshold.
+
+Примеры:
+    python bench.py                                  # синтетические свечи, все config.my_symbols
+    python bench.py --latency 0.05 --rate 100 --error-rate 0.01
+    python bench.py --record fixtures.json.gz        # записать живые свечи Bybit в фикстуры
+    python bench.py --fixtures fixtures.json.gz --baseline bench_baseline.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+import config
+import main
+from fake_bybit import FakeBybit, SimulatedClock, load_fixtures, save_fixtures
+from fetcher import RateLimiter, fetch_all
+
+# Для каких метрик лучше меньшее значение, для каких - большее
+LOWER_IS_BETTER = ('cycle_sec', 'p50_ms', 'p99_ms', 'peak_mem_mb')
+HIGHER_IS_BETTER = ('symbols_per_sec',)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def record(path, symbols, limit=200):
+    """Записывает текущие свечи Bybit по символам в файл фикстур."""
+    klines = fetch_all(symbols, lambda s: main.fetch_klines(s, '5', limit), max_workers=config.MAX_WORKERS)
+    klines = {s: rows for s, rows in klines.items() if rows}
+    save_fixtures(path, klines)
+    print(f"Записано {len(klines)} символов в {path}")
+
+
+def run_cycle(symbols, get_data):
+    """Один проход как в main(): загрузка + проверка сигналов. Возвращает задержки по символам."""
+    latencies = {}
+
+    def timed(symbol):
+        started = time.perf_counter()
+        try:
+            return get_data(symbol)
+        finally:
+            latencies[symbol] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    loaded = fetch_all(symbols, timed, max_workers=config.MAX_WORKERS)
+    # Каждый проход проверяет все символы заново - свечи в бенчмарке не обязаны быть новыми
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.check_loaded(loaded, lambda symbol, bar_ts: True, {})
+    done = sum(1 for data in loaded.values() if data is not None and len(data))
+    return time.perf_counter() - started, latencies, done
+
+
+def bench(name, symbols, get_data, cycles, warmup, clock):
+    def cycle():
+        # Между проходами на сервере закрывается одна свеча
+        clock.advance()
+        return run_cycle(symbols, get_data)
+
+    for _ in range(warmup):
+        cycle()
+    cycle_times, latencies, ok = [], [], 0
+    for _ in range(cycles):
+        elapsed, per_symbol, done = cycle()
+        cycle_times.append(elapsed)
+        latencies.extend(per_symbol.values())
+        ok += done
+    # Память - отдельным проходом: tracemalloc заметно замедляет код
+    tracemalloc.start()
+    cycle()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    cycle_sec = sum(cycle_times) / len(cycle_times)
+    return {
+        'mode': name,
+        'symbols': len(symbols),
+        'ok_ratio': round(ok / (len(symbols) * cycles), 4),
+        'cycle_sec': round(cycle_sec, 4),
+        'symbols_per_sec': round(len(symbols) / cycle_sec, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'peak_mem_mb': round(peak / 2 ** 20, 2),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Список строк с регрессиями относительно baseline."""
+    regressions = []
+    for result in results:
+        base = baseline.get(result['mode'])
+        if not base:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old if metric in LOWER_IS_BETTER else (old - new) / old
+            if change > threshold:
+                regressions.append(f"{result['mode']}.{metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def main_bench(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, default=len(config.my_symbols), help='сколько символов из config.my_symbols')
+    parser.add_argument('--fixtures', help='файл записанных свечей (json/json.gz)')
+    parser.add_argument('--record', help='записать живые свечи Bybit в этот файл и выйти')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа сервера, сек')
+    parser.add_argument('--jitter', type=float, default=0.0, help='случайная добавка к задержке, сек')
+    parser.add_argument('--rate', type=float, default=None, help='лимит сервера, запросов/сек')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов с ошибкой')
+    parser.add_argument('--client-rate', type=float, default=None,
+                        help='лимит запросов самого бота, запросов/сек (по умолчанию из config)')
+    parser.add_argument('--mode', choices=('full', 'buffered', 'both'), default='both')
+    parser.add_argument('--cycles', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--baseline', help='json с прошлым результатом для сравнения')
+    parser.add_argument('--save-baseline', help='сохранить результат в этот json')
+    parser.add_argument('--threshold', type=float, default=0.2, help='допустимое ухудшение (0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    symbols = config.my_symbols[:args.symbols]
+    if args.record:
+        record(args.record, symbols)
+        return 0
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else None
+    clock = SimulatedClock()
+    server = FakeBybit(symbols, fixtures=fixtures, latency=args.latency, jitter=args.jitter,
+                       rate_limit=args.rate, error_rate=args.error_rate, clock=clock).start()
+    main.session.endpoint = server.url
+    if args.client_rate:
+        main.limiter = RateLimiter(args.client_rate, args.client_rate)
+    # Бенчмарк не должен трогать хранилище свечей на диске
+    main.store = None
+
+    results = []
+    try:
+        if args.mode in ('full', 'both'):
+            # Как в main.scan_symbols: с пакетным движком MACD считается сразу по всем символам
+            get_full = main.get_candles if config.USE_BATCH_ENGINE else main.get_historical_data
+            results.append(bench('full', symbols, get_full, args.cycles, args.warmup, clock))
+        if args.mode in ('buffered', 'both'):
+            main.buffers.clear()
+            limits_before = Counter(server.kline_limits)
+            results.append(bench('buffered', symbols, main.get_buffered_data, args.cycles, args.warmup, clock))
+            results[-1]['kline_limits'] = dict(sorted((server.kline_limits - limits_before).items()))
+    finally:
+        server.stop()
+
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+    print(f"Запросов к серверу: {server.requests}, отклонено лимитом: {server.rejected}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({r['mode']: r for r in results}, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("РЕГРЕССИЯ:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("Регрессий нет.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_bench())
@@ -0,0 +1,257 @@
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover']
+
+
+def parse_row(row):
+    """Свеча get_kline (список строк) -> кортеж чисел в порядке COLUMNS."""
+    return (int(row[0]), float(row[1]), float(row[2]), float(row[3]),
+            float(row[4]), float(row[5]), float(row[6]))
+
+
+class StreamingEMA:
+    """
+    EMA, совпадающая с pandas_ta.ema: первое значение - SMA первых `length`
+    точек, дальше ewm(span=length, adjust=False). Обновление за O(1).
+    """
+
+    def __init__(self, length):
+        self.length = length
+        self.alpha = 2 / (length + 1)
+        self.value = None
+        self.seed = []
+
+    def peek(self, x):
+        """Значение EMA, если добавить x, без изменения состояния."""
+        if self.value is not None:
+            return self.value + self.alpha * (x - self.value)
+        if len(self.seed) + 1 == self.length:
+            return (sum(self.seed) + x) / self.length
+        return None
+
+    def update(self, x):
+        value = self.peek(x)
+        if value is None:
+            self.seed.append(x)
+        else:
+            self.value = value
+            self.seed = []
+        return value
+
+
+class StreamingMACD:
+    """
+    Потоковый MACD(fast, slow, signal) - те же значения, что дает
+    df.ta.macd(): (MACD, гистограмма, сигнальная линия).
+    Пока не накоплено достаточно свечей, возвращает None на месте значений.
+    """
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast = StreamingEMA(fast)
+        self.slow = StreamingEMA(slow)
+        self.signal = StreamingEMA(signal)
+
+    def _step(self, close, commit):
+        fast = self.fast.update(close) if commit else self.fast.peek(close)
+        slow = self.slow.update(close) if commit else self.slow.peek(close)
+        if fast is None or slow is None:
+            return None, None, None
+        macd = fast - slow
+        signal = self.signal.update(macd) if commit else self.signal.peek(macd)
+        if signal is None:
+            return macd, None, None
+        return macd, macd - signal, signal
+
+    def update(self, close):
+        """Добавляет закрытую свечу."""
+        return self._step(close, commit=True)
+
+    def peek(self, close):
+        """Значения для еще не закрытой свечи - состояние не меняется."""
+        return self._step(close, commit=False)
+
+
+class CandleBuffer:
+    """
+    Скользящий буфер последних закрытых свечей символа с потоковым MACD.
+
+    Полную историю (size свечей) загружаем один раз, дальше запрашиваем
+    только свечи новее последней сохраненной (обычно limit=2..3).
+    Последняя свеча ответа Bybit - текущая незакрытая, ее MACD считаем
+    через peek(), не меняя состояния EMA.
+
+    Строки кадра доступны и без DataFrame: len(buffer) - число строк
+    to_frame(), arrays() - колонки массивами numpy. Кадр строится только
+    для символов, которые действительно проверяются.
+    """
+
+    def __init__(self, symbol, interval=5, size=200, fast=12, slow=26, signal=9):
+        self.symbol = symbol
+        self.interval_ms = int(interval) * 60 * 1000
+        self.size = size
+        self.params = (fast, slow, signal)
+        suffix = f"{fast}_{slow}_{signal}"
+        self.macd_columns = [f"MACD_{suffix}", f"MACDh_{suffix}", f"MACDs_{suffix}"]
+        self.frame_columns = COLUMNS + self.macd_columns
+        # столько строк остается после dropna() в get_historical_data,
+        # одна из них - незакрытая свеча
+        self.window = size - (slow + signal - 2)
+        self.reset()
+
+    def reset(self):
+        self.closed = deque(maxlen=self.window - 1)
+        # Те же закрытые свечи в numpy. Каждая строка пишется дважды (i и
+        # i + maxlen), поэтому последние n строк всегда лежат подряд
+        self.ring = np.full((2 * self.closed.maxlen, len(self.frame_columns)), np.nan)
+        self.count = 0
+        self.macd_rows = 0
+        self.forming = None
+        self.last_ts = None
+        self.macd = StreamingMACD(*self.params)
+
+    def load(self, columns, min_bars=None):
+        """
+        Начальное заполнение из сохраненной истории: {колонка: массив}
+        (см. CandleStore.read). Берется только непрерывный хвост; если он
+        короче min_bars (по умолчанию size - 1 свечей, как при полной
+        загрузке), буфер остается пустым и история загрузится через API.
+        """
+        if min_bars is None:
+            min_bars = self.size - 1
+        ts = columns['timestamp'][-(self.size - 1):]
+        breaks = np.flatnonzero(np.diff(ts) != self.interval_ms)
+        start = breaks[-1] + 1 if len(breaks) else 0
+        if not len(ts) or len(ts) - start < min_bars:
+            return
+        for candle in zip(*(columns[c][-(self.size - 1):][start:].tolist() for c in COLUMNS)):
+            self._append(candle)
+
+    def _append(self, candle):
+        """Закрытая свеча (кортеж в порядке COLUMNS) - в буфер, с обновлением MACD."""
+        row = candle + self.macd.update(candle[4])
+        self.closed.append(row)
+        maxlen = self.closed.maxlen
+        i = self.count % maxlen
+        self.ring[i] = self.ring[i + maxlen] = [np.nan if v is None else v for v in row]
+        self.count += 1
+        if row[8] is not None:
+            self.macd_rows = min(self.macd_rows + 1, maxlen)
+        self.last_ts = candle[0]
+
+    def fetch_limit(self, now_ms):
+        """Сколько свечей запросить, чтобы покрыть все новые (с одной свечой перекрытия)."""
+        if self.last_ts is None:
+            return self.size
+        forming_ts = now_ms - now_ms % self.interval_ms
+        missing = (forming_ts - self.last_ts) // self.interval_ms
+        if missing >= self.size:
+            return self.size
+        return max(2, missing + 1)
+
+    def refresh(self, fetch, now_ms):
+        """
+        Догрузка через REST: fetch(limit) возвращает свечи get_kline (новые
+        первыми) или None. Пропуск длиннее буфера или разрыв в ответе -
+        история загружается заново. Возвращает False, если данных нет.
+        """
+        limit = self.fetch_limit(now_ms)
+        if limit >= self.size:
+            # Пропуск длиннее буфера - проще загрузить историю целиком
+            self.reset()
+        data = fetch(limit)
+        if not data:
+            return False
+        with metrics.timer('macd'):
+            updated = self.update(data)
+        if not updated:
+            # В истории разрыв (долгий простой, сбой биржи) - загружаем заново
+            self.reset()
+            data = fetch(self.size)
+            if not data:
+                return False
+            with metrics.timer('macd'):
+                return self.update(data)
+        return True
+
+    def update(self, rows):
+        """
+        Принимает список свечей в формате get_kline (строки, новые первыми).
+        Возвращает False, если между буфером и ответом есть разрыв -
+        тогда буфер нужно сбросить и загрузить историю заново.
+        """
+        candles = sorted(parse_row(r) for r in rows)
+        if not candles:
+            return True
+        *closed, forming = candles
+        fresh = [c for c in closed if self.last_ts is None or c[0] > self.last_ts]
+        for candle in fresh:
+            if self.last_ts is not None and candle[0] != self.last_ts + self.interval_ms:
+                return False
+            self._append(candle)
+        if self.last_ts is not None and forming[0] <= self.last_ts:
+            return True
+        self.forming = forming + self.macd.peek(forming[4])
+        return True
+
+    def push(self, candle, confirmed):
+        """
+        Одна свеча из WebSocket-потока: кортеж (timestamp, open, high, low,
+        close, volume, turnover). Закрытую свечу (confirm=true) добавляет в
+        буфер, незакрытую - обновляет как текущую. Возвращает False, если
+        пропущены свечи и нужна догрузка через REST.
+        """
+        ts = candle[0]
+        if self.last_ts is not None and ts <= self.last_ts:
+            return True  # повтор уже учтенной свечи
+        if self.last_ts is None or ts != self.last_ts + self.interval_ms:
+            return False
+        if not confirmed:
+            self.forming = candle + self.macd.peek(candle[4])
+            return True
+        self._append(candle)
+        # Следующая свеча еще не пришла - до первого обновления считаем ее плоской
+        close = candle[4]
+        placeholder = (ts + self.interval_ms, close, close, close, close, 0.0, 0.0)
+        self.forming = placeholder + self.macd.peek(close)
+        return True
+
+    def _forming_row(self):
+        if self.forming is not None and self.forming[8] is not None:
+            return self.forming
+        return None
+
+    def __len__(self):
+        """Число строк to_frame()."""
+        return self.macd_rows + (self._forming_row() is not None)
+
+    def arrays(self, columns):
+        """
+        {колонка: массив} - строки to_frame() без построения DataFrame;
+        'timestamp' - в миллисекундах UTC.
+        """
+        end = self.count % self.closed.maxlen + self.closed.maxlen
+        rows = self.ring[end - self.macd_rows:end]
+        forming = self._forming_row()
+        result = {}
+        for column in columns:
+            values = rows[:, self.frame_columns.index(column)]
+            if forming is not None:
+                values = np.append(values, forming[self.frame_columns.index(column)])
+            result[column] = values
+        return result
+
+    def to_frame(self):
+        """DataFrame в том же виде, что возвращает get_historical_data()."""
+        rows = [c for c in self.closed if c[8] is not None]
+        if self.forming is not None and self.forming[8] is not None:
+            rows.append(self.forming)
+        df = pd.DataFrame(rows, columns=self.frame_columns)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
+        df = df.set_index('timestamp')
+        df.index = df.index.tz_convert('Asia/Yekaterinburg')
+        return df
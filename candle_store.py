@@ -0,0 +1,157 @@
+"""
+Хранилище закрытых свечей на диске.
+
+Для каждой пары (интервал, символ) - каталог с отдельным файлом на колонку
+фиксированной ширины (timestamp - int64, остальные - float64):
+
+    <root>/<interval>/<symbol>/timestamp.i8, open.f8, ..., turnover.f8
+
+Файлы только дописываются, читаются через np.memmap без копирования,
+поэтому одни и те же свечи могут читать другие процессы (анализ, второй
+сканер) без запросов к API. Писать могут несколько процессов (символ
+переезжает между воркерами shard.py): дозапись идет под файловой
+блокировкой каталога символа и сверяется с хвостом на диске.
+"""
+import contextlib
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from candle_buffer import COLUMNS
+
+DTYPES = {column: np.float64 for column in COLUMNS}
+DTYPES['timestamp'] = np.int64
+
+
+def _filename(column):
+    return f"{column}.i8" if column == 'timestamp' else f"{column}.f8"
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """Межпроцессная блокировка на время записи (файл path создается при необходимости)."""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class CandleStore:
+    """Колоночное хранилище свечей в каталоге root (см. описание модуля)."""
+
+    def __init__(self, root):
+        self.root = root
+        self.locks = {}
+        self.last = {}
+        self.lock = threading.Lock()
+
+    def path(self, symbol, interval):
+        return os.path.join(self.root, str(interval), symbol)
+
+    def _lock(self, key):
+        with self.lock:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def keys(self):
+        """Все пары (symbol, interval), по которым есть данные."""
+        if not os.path.isdir(self.root):
+            return
+        for interval in sorted(os.listdir(self.root)):
+            for symbol in sorted(os.listdir(os.path.join(self.root, interval))):
+                yield symbol, interval
+
+    def count(self, symbol, interval):
+        """Число записанных свечей. Строка считается записанной, когда есть ее timestamp."""
+        try:
+            size = os.path.getsize(os.path.join(self.path(symbol, interval), _filename('timestamp')))
+        except OSError:
+            return 0
+        return size // 8
+
+    def _read_last_ts(self, symbol, interval):
+        n = self.count(symbol, interval)
+        if n == 0:
+            return None
+        ts = np.memmap(os.path.join(self.path(symbol, interval), _filename('timestamp')),
+                       dtype=np.int64, mode='r', shape=(n,))
+        return int(ts[-1])
+
+    def last_ts(self, symbol, interval):
+        """
+        Время последней записанной свечи, запомненное этим процессом. Другой
+        процесс мог дописать больше - для отбора новых свечей это не страшно,
+        append() все равно сверяется с диском.
+        """
+        key = (symbol, str(interval))
+        if key not in self.last:
+            self.last[key] = self._read_last_ts(symbol, interval)
+        return self.last[key]
+
+    def append(self, symbol, interval, candles):
+        """
+        Дописывает закрытые свечи (кортежи в порядке COLUMNS, по возрастанию
+        времени). Свечи не новее последней записанной пропускаются.
+        Возвращает число записанных свечей.
+        """
+        key = (symbol, str(interval))
+        directory = self.path(symbol, interval)
+        os.makedirs(directory, exist_ok=True)
+        with self._lock(key), _file_lock(os.path.join(directory, '.lock')):
+            last = self._read_last_ts(symbol, interval)
+            self.last[key] = last
+            rows = [c for c in candles if last is None or c[0] > last]
+            if not rows:
+                return 0
+            n = self.count(symbol, interval)
+            data = list(zip(*rows))
+            # timestamp пишем последним: по нему читатели определяют длину,
+            # а недописанный после сбоя хвост остальных колонок обрезаем
+            for i, column in reversed(list(enumerate(COLUMNS))):
+                path = os.path.join(directory, _filename(column))
+                with open(path, 'ab') as f:
+                    if f.tell() != n * 8:
+                        f.truncate(n * 8)
+                        f.seek(n * 8)
+                    f.write(np.asarray(data[i], dtype=DTYPES[column]).tobytes())
+            self.last[key] = rows[-1][0]
+            return len(rows)
+
+    def read(self, symbol, interval, limit=None):
+        """
+        Свечи символа как {колонка: массив} - отображения файлов в память
+        (только чтение). limit - сколько последних свечей вернуть.
+        """
+        n = self.count(symbol, interval)
+        start = 0 if limit is None else max(0, n - limit)
+        result = {}
+        for column in COLUMNS:
+            if n == 0:
+                result[column] = np.empty(0, dtype=DTYPES[column])
+                continue
+            mm = np.memmap(os.path.join(self.path(symbol, interval), _filename(column)),
+                           dtype=DTYPES[column], mode='r', shape=(n,))
+            result[column] = mm[start:]
+        return result
+
+    def sync(self, symbol, interval, buffer):
+        """Дописывает закрытые свечи буфера, которых еще нет на диске."""
+        last = self.last_ts(symbol, interval)
+        return self.append(symbol, interval, [c[:len(COLUMNS)] for c in buffer.closed
+                                              if last is None or c[0] > last])
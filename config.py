@@ -63,4 +63,77 @@ my_symbols = [
     'XTERUSDT', 'XTZUSDT', 'XUSDT', 'XUSDUSDT', 'YBUSDT', 'YFIUSDT', 'ZBTUSDT', 'ZENTUSDT',
     'ZENUSDT', 'ZEREBROUSDT', 'ZEROUSDT', 'ZETAUSDT', 'ZEXUSDT', 'ZIGUSDT', 'ZILUSDT', 'ZKCUSDT',
     'ZKJUSDT', 'ZKLUSDT', 'ZKUSDT', 'ZORAUSDT', 'ZRCUSDT', 'ZROUSDT', 'ZRXUSDT', 'ZTXUSDT',
-    ]
\ No newline at end of file
+    ]
+
+# --- Параллельная загрузка свечей ---
+# Лимит Bybit для REST - 600 запросов за 5 секунд с одного IP,
+# держим запас, чтобы не упираться в 10006/403
+RATE_LIMIT_PER_SEC = 80     # средняя скорость запросов
+RATE_LIMIT_BURST = 80       # допустимый всплеск запросов
+MAX_WORKERS = 10            # сколько запросов выполняется одновременно (= пул соединений requests)
+MAX_RETRIES = 3             # повторы при временных ошибках API
+RETRY_BACKOFF = 0.5         # базовая задержка перед повтором, сек (удваивается)
+
+# --- Инкрементальное обновление свечей ---
+USE_CANDLE_BUFFER = True    # False - каждый цикл заново качать всю историю
+CANDLE_HISTORY = 200        # сколько свечей хранить на символ (как limit в get_historical_data)
+
+# --- Режим WebSocket (ws_stream.py) ---
+WS_TOPICS_PER_REQUEST = 10         # Bybit spot принимает до 10 топиков в одном subscribe
+WS_SYMBOLS_PER_CONNECTION = 100    # топиков на одно соединение
+WS_WORKERS = 4                     # потоков обработки свечей (символ всегда в одном потоке)
+WS_STALE_AFTER = 90                # сек без сообщений - соединение пересоздается
+WS_BACKFILL_GRACE = 15             # сек после закрытия свечи до проверки пропусков
+
+# --- Пакетная проверка сигнала (vector_engine.py) ---
+USE_BATCH_ENGINE = True     # поиск пересечений нуля сразу по всем символам (без DataFrame, на полном пути - и MACD); False - check_entry_signal() по каждому
+
+# --- Хранилище свечей на диске (candle_store.py) ---
+CANDLE_STORE_DIR = 'data/candles'   # None - не сохранять свечи на диск
+
+# --- Планировщик проходов (scheduler.py) ---
+SCHEDULE_SETTLE_SEC = 3     # пауза после закрытия свечи, чтобы биржа отдала ее закрытой
+SCAN_DEADLINE_SEC = None    # сек от закрытия свечи на проход; None - до закрытия следующей
+
+# --- Метрики (metrics.py) ---
+METRICS_ENABLED = False         # счетчики и таймеры этапов
+METRICS_PORT = 9108             # http://127.0.0.1:9108/metrics, /summary, /profile/start|stop; None - без сервера
+METRICS_SUMMARY_SEC = 300       # период JSON-сводки, сек; None - не выводить
+METRICS_SUMMARY_PATH = None     # файл для JSON-сводки (строка на сводку); None - в консоль
+
+# --- Адрес REST API ---
+BYBIT_ENDPOINT = None   # например, 'http://127.0.0.1:8080' для fake_bybit.py; None - api.bybit.com
+
+# --- Вывод событий (events.py) ---
+EVENTS_CONSOLE = True                   # короткие строки о сигналах в консоль
+EVENTS_FILE = 'logs/signals.jsonl'      # JSONL-файл событий; None - не писать
+EVENTS_FILE_MAX_BYTES = 10 * 2 ** 20    # размер файла до ротации
+EVENTS_FILE_BACKUPS = 5                 # сколько старых файлов хранить
+EVENTS_SOCKET = None                    # ('127.0.0.1', 9200) - слать JSONL в локальный TCP-сокет
+EVENTS_WEBHOOK_URL = None               # URL для POST пачек событий
+EVENTS_BATCH_SIZE = 100                 # событий в пачке
+EVENTS_FLUSH_SEC = 0.5                  # максимальная задержка вывода пачки
+DEBUG_FRAME_DUMP = False                # печатать весь DataFrame при пересечении нуля (медленно)
+
+# --- Список токенов (universe.py) ---
+# my_symbols выше используется как запасной список, если биржа недоступна
+UNIVERSE_AUTO_REFRESH = True        # брать список токенов с биржи и обновлять его в фоне
+UNIVERSE_REFRESH_SEC = 900          # период обновления, сек
+UNIVERSE_QUOTE = "USDT"             # котируемая монета; None - все
+UNIVERSE_MIN_TURNOVER_24H = 50_000  # минимальный оборот за 24 часа, в котируемой монете
+UNIVERSE_MAX_SPREAD_PCT = 1.0       # максимальный спред bid/ask, %; None - не проверять
+UNIVERSE_ILLIQUID = 'drop'          # 'drop' - не проверять неликвидные, 'last' - проверять последними
+
+# --- Старшие таймфреймы (timeframes.py) ---
+# Собираются из 5-минутных свечей, без отдельных запросов к API
+TIMEFRAMES = []                 # например, ['15', '60', '240']; [] - только 5m
+MTF_MODE = 'each'               # 'each' - сигнал на каждом таймфрейме, 'confluence' - еще и совпадение на всех
+MTF_CONFLUENCE_WINDOW = 3600    # сек между входами на разных таймфреймах, чтобы считать их совпавшими
+MTF_HISTORY = 200               # свечей на таймфрейм (прогрев - из хранилища 5-минуток)
+
+# --- Шардированный режим (shard.py) ---
+SHARD_WORKERS = 4                   # локальных процессов-воркеров у координатора
+SHARD_LISTEN = '127.0.0.1:50000'    # адрес координатора; для воркеров на других машинах - '0.0.0.0:50000'
+SHARD_AUTHKEY = b'change-me'        # общий ключ координатора и воркеров
+SHARD_HEARTBEAT_SEC = 5             # как часто воркер сообщает, что жив
+SHARD_WORKER_TIMEOUT = 30           # сек без сообщений - воркер считается пропавшим, его символы переезжают
@@ -0,0 +1,221 @@
+"""
+Неблокирующий вывод событий сканера.
+
+check_entry_signal() и другие места вызывают emit(...) - событие кладется
+в очередь и сразу возвращает управление. Фоновый поток собирает события
+пачками, превращает в JSON-строки и отдает выходам: файлу с ротацией,
+консоли, локальному сокету, вебхуку.
+
+События:
+    zero_cross          - гистограмма пересекла ноль снизу вверх
+    divergence_aborted  - поиск дивергенции прерван (reason)
+    divergence_candidate - кандидат: candle1/candle2 и проверка условий
+    long_entry          - найдена точка входа в лонг
+    confluence_entry    - точки входа совпали на всех таймфреймах (timeframes.py)
+
+У событий старших таймфреймов есть поле timeframe ('15', '60', ...).
+
+Пока configure() не вызван, emit() ничего не делает.
+"""
+import atexit
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import urllib.request
+
+
+class FileOutput:
+    """JSONL-файл с ротацией: path, path.1, ..., path.<backups>."""
+
+    def __init__(self, path, max_bytes=10 * 2 ** 20, backups=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def write(self, records, lines):
+        data = ''.join(line + '\n' for line in lines).encode('utf-8')
+        if os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+            self._rotate()
+        with open(self.path, 'ab') as f:
+            f.write(data)
+
+
+class ConsoleOutput:
+    """Короткие строки для человека в консоли."""
+
+    def write(self, records, lines):
+        out = []
+        for r in records:
+            event, symbol = r['event'], r.get('symbol')
+            if r.get('timeframe'):
+                symbol = f"{symbol} {r['timeframe']}m"
+            if event == 'zero_cross':
+                out.append(f"[{symbol}] !!! СИГНАЛ: Гистограмма пересекла ноль ({r['prev_hist']:.8g} -> {r['hist']:.8g}). Ищу дивергенцию...")
+            elif event == 'divergence_aborted':
+                out.append(f"[{symbol}] Поиск дивергенции прерван: {r['reason']}")
+            elif event == 'divergence_candidate':
+                c1, c2 = r['candle1'], r['candle2']
+                out.append(f"[{symbol}] Кандидат на дивергенцию: "
+                           f"Свеча 1 ({c1['time']}) MACD={c1['macd']:.8f} Low={c1['low']}, "
+                           f"Свеча 2 ({c2['time']}) MACD={c2['macd']:.8f} Low={c2['low']}, "
+                           f"Разница цен {r['price_diff']:.2f}%")
+            elif event == 'long_entry':
+                out.append("=" * 50)
+                out.append(f"!!! НАЙДЕНА ТОЧКА ВХОДА В ЛОНГ ДЛЯ {symbol} !!!")
+                out.append(f"Время сигнала (ЕКБ): {r['time']}")
+                out.append(f"Цена входа (Close): {r['close']}")
+                out.append("=" * 50)
+            elif event == 'confluence_entry':
+                out.append("=" * 50)
+                out.append(f"!!! ВХОД В ЛОНГ ДЛЯ {symbol} ПОДТВЕРЖДЕН НА ТАЙМФРЕЙМАХ {', '.join(r['timeframes'])} !!!")
+                out.append(f"Время сигнала (ЕКБ): {r['time']}")
+                out.append(f"Цена входа (Close): {r['close']}")
+                out.append("=" * 50)
+        if out:
+            print('\n'.join(out), flush=True)
+
+
+class SocketOutput:
+    """JSON-строки в локальный TCP-сокет; при обрыве переподключается на следующей пачке."""
+
+    def __init__(self, host, port, timeout=2.0):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.sock = None
+
+    def write(self, records, lines):
+        data = ''.join(line + '\n' for line in lines).encode('utf-8')
+        try:
+            if self.sock is None:
+                self.sock = socket.create_connection(self.address, timeout=self.timeout)
+            self.sock.sendall(data)
+        except OSError:
+            if self.sock is not None:
+                self.sock.close()
+            self.sock = None
+            raise
+
+
+class WebhookOutput:
+    """
+    Заготовка вебхука: пачка событий одним POST с JSON-массивом.
+    Без url только запоминает последние пачки (для проверки и отладки).
+    """
+
+    def __init__(self, url=None, timeout=5.0, keep=100):
+        self.url = url
+        self.timeout = timeout
+        self.keep = keep
+        self.sent = []
+
+    def write(self, records, lines):
+        if not self.url:
+            self.sent.append(records)
+            del self.sent[:-self.keep]
+            return
+        request = urllib.request.Request(
+            self.url, data=json.dumps(records, ensure_ascii=False).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}, method='POST',
+        )
+        urllib.request.urlopen(request, timeout=self.timeout).close()
+
+
+class EventSink:
+    """
+    Очередь событий и фоновый писатель. Пачка уходит в выходы, когда
+    набралось batch_size событий или прошло flush_interval секунд.
+    При переполнении очереди новые события отбрасываются (счетчик dropped) -
+    сканер не должен ждать вывода.
+    """
+
+    def __init__(self, outputs, batch_size=100, flush_interval=0.5, max_queue=10000):
+        self.outputs = list(outputs)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def emit(self, event, **fields):
+        record = {'ts': round(time.time(), 3), 'event': event}
+        record.update(fields)
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while self.running or not self.queue.empty():
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        lines = [json.dumps(r, ensure_ascii=False, default=str) for r in batch]
+        for output in self.outputs:
+            try:
+                output.write(batch, lines)
+            except Exception as e:
+                print(f"Ошибка вывода событий ({output.__class__.__name__}): {e}")
+
+    def close(self, timeout=5.0):
+        """Дописывает оставшиеся события и останавливает поток."""
+        self.running = False
+        self.thread.join(timeout)
+
+
+_sink = None
+
+
+def configure(outputs, **kwargs):
+    """Создает общий EventSink для emit(). Повторный вызов заменяет его."""
+    global _sink
+    if _sink is not None:
+        _sink.close()
+    _sink = EventSink(outputs, **kwargs)
+    atexit.register(_sink.close)
+    return _sink
+
+
+def configure_from_config(config):
+    outputs = []
+    if config.EVENTS_CONSOLE:
+        outputs.append(ConsoleOutput())
+    if config.EVENTS_FILE:
+        outputs.append(FileOutput(config.EVENTS_FILE, config.EVENTS_FILE_MAX_BYTES, config.EVENTS_FILE_BACKUPS))
+    if config.EVENTS_SOCKET:
+        outputs.append(SocketOutput(*config.EVENTS_SOCKET))
+    if config.EVENTS_WEBHOOK_URL:
+        outputs.append(WebhookOutput(config.EVENTS_WEBHOOK_URL))
+    return configure(outputs, batch_size=config.EVENTS_BATCH_SIZE, flush_interval=config.EVENTS_FLUSH_SEC)
+
+
+def emit(event, **fields):
+    if _sink is not None:
+        _sink.emit(event, **fields)
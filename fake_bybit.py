@@ -0,0 +1,263 @@
+"""
+Локальная замена REST API Bybit для бенчмарков и офлайн-прогонов.
+
+Отвечает на /v5/market/kline, /v5/market/instruments-info и
+/v5/market/tickers в формате Bybit. Свечи берутся из записанных фикстур (см. bench.py --record) или
+генерируются детерминированно по имени символа. Можно задать задержку
+ответа, лимит запросов (retCode 10006 при превышении) и долю ошибок.
+
+Время свечей идет по часам сервера (clock): с SimulatedClock каждый
+advance() закрывает по свече, и буферы бота получают новые свечи так же,
+как на бирже.
+
+Чтобы бот ходил сюда, достаточно main.session.endpoint = server.url
+(или BYBIT_ENDPOINT в config.py).
+"""
+import gzip
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from fetcher import RateLimiter
+
+INTERVAL_MS = {'1': 60_000, '3': 180_000, '5': 300_000, '15': 900_000, '30': 1_800_000,
+               '60': 3_600_000, '120': 7_200_000, '240': 14_400_000, '360': 21_600_000,
+               '720': 43_200_000, 'D': 86_400_000}
+
+
+def load_fixtures(path):
+    """Фикстуры: {symbol: [строки get_kline, новые первыми]} в json или json.gz."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_fixtures(path, klines):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt', encoding='utf-8') as f:
+        json.dump(klines, f)
+
+
+class SimulatedClock:
+    """Часы сервера: стоят на месте, advance() переводит их на step секунд вперед."""
+
+    def __init__(self, start=None, step=300):
+        self.now = time.time() if start is None else start
+        self.step = step
+
+    def __call__(self):
+        return self.now
+
+    def advance(self):
+        self.now += self.step
+
+
+class FixtureKlines:
+    """
+    Записанные свечи, привязанные к часам сервера: в момент запуска самая
+    новая строка фикстуры - текущая незакрытая свеча, дальше запись
+    проигрывается по кругу, по свече на интервал. Время и значения каждой
+    свечи не меняются, поэтому бот видит обычный поток новых свечей.
+    """
+
+    def __init__(self, fixtures, start_ms):
+        self.series = {}
+        for symbol, rows in fixtures.items():
+            if not rows:
+                continue
+            rows = sorted(rows, key=lambda r: int(r[0]))
+            interval_ms = int(rows[1][0]) - int(rows[0][0]) if len(rows) > 1 else INTERVAL_MS['5']
+            self.series[symbol] = (rows, interval_ms, start_ms - start_ms % interval_ms)
+
+    def __contains__(self, symbol):
+        return symbol in self.series
+
+    def get(self, symbol, limit, now_ms):
+        rows, interval_ms, start_ts = self.series[symbol]
+        forming_ts = now_ms - now_ms % interval_ms
+        result = []
+        for k in range(min(limit, len(rows))):
+            ts = forming_ts - k * interval_ms
+            row = rows[(len(rows) - 1 + (ts - start_ts) // interval_ms) % len(rows)]
+            result.append([str(ts)] + row[1:])
+        return result
+
+
+class SyntheticKlines:
+    """
+    Детерминированные свечи: цена каждого символа - случайное блуждание
+    с зерном от имени символа, время выровнено по реальным границам свечей.
+    """
+
+    def __init__(self, history=1000):
+        self.history = history
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def _series(self, symbol, interval_ms, last_ts):
+        key = (symbol, interval_ms)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                rng = random.Random(zlib.crc32(symbol.encode()))
+                first_ts = last_ts - (self.history - 1) * interval_ms
+                series = {'rng': rng, 'first_ts': first_ts, 'candles': [], 'price': rng.uniform(0.01, 1000)}
+                self.series[key] = series
+            candles = series['candles']
+            rng = series['rng']
+            while series['first_ts'] + (len(candles) - 1) * interval_ms < last_ts:
+                ts = series['first_ts'] + len(candles) * interval_ms
+                o = series['price']
+                c = o * (1 + rng.gauss(0, 0.01))
+                h = max(o, c) * (1 + abs(rng.gauss(0, 0.003)))
+                l = min(o, c) * (1 - abs(rng.gauss(0, 0.003)))
+                v = rng.uniform(100, 10000)
+                candles.append([str(ts), repr(o), repr(h), repr(l), repr(c), repr(v), repr(v * c)])
+                series['price'] = c
+            return series
+
+    def get(self, symbol, interval, limit, now_ms):
+        interval_ms = INTERVAL_MS[interval]
+        forming_ts = now_ms - now_ms % interval_ms
+        series = self._series(symbol, interval_ms, forming_ts)
+        end = (forming_ts - series['first_ts']) // interval_ms + 1
+        return series['candles'][max(0, end - limit):end][::-1]
+
+
+class FakeBybit:
+    """
+    latency/jitter - задержка ответа в секундах, rate_limit - запросов в
+    секунду (None - без лимита), error_rate - доля ответов с ошибкой
+    (поровну retCode 10016 и HTTP 502). clock - часы сервера в секундах
+    (по умолчанию time.time, для бенчмарка - SimulatedClock).
+    """
+
+    def __init__(self, symbols, fixtures=None, latency=0.0, jitter=0.0, rate_limit=None,
+                 error_rate=0.0, seed=0, clock=None):
+        self.symbols = list(symbols)
+        self.clock = clock or time.time
+        self.fixtures = FixtureKlines(fixtures, self._now_ms()) if fixtures is not None else None
+        self.synthetic = SyntheticKlines()
+        self.latency = latency
+        self.jitter = jitter
+        self.limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.rejected = 0
+        # Запросы свечей по limit: по ним видно, докачивает бот или грузит историю целиком
+        self.kline_limits = Counter()
+        self.lock = threading.Lock()
+        self.server = None
+
+    def _now_ms(self):
+        return int(self.clock() * 1000)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle(self, path, params):
+        """Возвращает (HTTP-статус, тело ответа)."""
+        with self.lock:
+            self.requests += 1
+            failed = self.rng.random() < self.error_rate
+            kind = self.rng.random()
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.rng.uniform(0, self.jitter))
+        if self.limiter is not None and self.limiter.try_acquire():
+            with self.lock:
+                self.rejected += 1
+            return 200, self._error(10006, "Too many visits!")
+        if failed:
+            if kind < 0.5:
+                return 502, {"error": "Bad Gateway"}
+            return 200, self._error(10016, "Server error")
+
+        if path == '/v5/market/kline':
+            return 200, self._kline(params)
+        if path == '/v5/market/instruments-info':
+            return 200, self._instruments(params)
+        if path == '/v5/market/tickers':
+            return 200, self._tickers(params)
+        return 404, {"error": "Not Found"}
+
+    def _error(self, code, message):
+        return {"retCode": code, "retMsg": message, "result": {}, "retExtInfo": {},
+                "time": self._now_ms()}
+
+    def _ok(self, result):
+        return {"retCode": 0, "retMsg": "OK", "result": result, "retExtInfo": {},
+                "time": self._now_ms()}
+
+    def _kline(self, params):
+        symbol = params.get('symbol')
+        interval = params.get('interval', '5')
+        limit = min(int(params.get('limit', 200)), 1000)
+        if symbol not in self.symbols or interval not in INTERVAL_MS:
+            return self._error(10001, "Not supported symbols")
+        with self.lock:
+            self.kline_limits[limit] += 1
+        if self.fixtures is not None and symbol in self.fixtures:
+            rows = self.fixtures.get(symbol, limit, self._now_ms())
+        else:
+            rows = self.synthetic.get(symbol, interval, limit, self._now_ms())
+        return self._ok({"category": params.get('category', 'spot'), "symbol": symbol, "list": rows})
+
+    def _instruments(self, params, page_size=500):
+        start = int(params.get('cursor') or 0)
+        page = self.symbols[start:start + page_size]
+        items = [{"symbol": s, "baseCoin": s[:-4], "quoteCoin": "USDT", "status": "Trading"} for s in page]
+        cursor = str(start + page_size) if start + page_size < len(self.symbols) else ""
+        return self._ok({"category": "spot", "list": items, "nextPageCursor": cursor})
+
+    def _tickers(self, params):
+        """Снимок тикеров: оборот и спред детерминированы по символу, часть пар неликвидна."""
+        now_ms = self._now_ms()
+        items = []
+        for symbol in self.symbols:
+            rng = random.Random(zlib.crc32(symbol.encode()) ^ 0x5EED)
+            last = float(self.synthetic.get(symbol, '5', 1, now_ms)[0][4])
+            spread = last * rng.choice((0.0001, 0.0005, 0.002, 0.02))
+            items.append({
+                "symbol": symbol, "lastPrice": repr(last),
+                "bid1Price": repr(last - spread / 2), "ask1Price": repr(last + spread / 2),
+                "turnover24h": repr(10 ** rng.uniform(3, 9)), "volume24h": repr(10 ** rng.uniform(3, 9) / last),
+            })
+        return self._ok({"category": params.get('category', 'spot'), "list": items})
+
+    def start(self, host='127.0.0.1', port=0):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                status, body = fake.handle(url.path, params)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
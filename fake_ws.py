@@ -0,0 +1,200 @@
+"""
+Локальная имитация Bybit для офлайн-проверки режима WebSocket.
+
+FakeExchange генерирует свечи по символам в ускоренном времени, рассылает
+сообщения kline.<interval>.<symbol> в формате публичного потока Bybit
+(confirm=true на закрытии свечи) и отвечает на запросы истории в формате
+get_kline. Клиенты FakeWebSocket повторяют интерфейс pybit WebSocket,
+поэтому KlineStream работает с ними без изменений.
+
+Запуск демо: python fake_ws.py
+"""
+import random
+import threading
+import time
+
+import config
+
+
+class FakeWebSocket:
+    """Клиент с интерфейсом pybit WebSocket, подключенный к FakeExchange."""
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.callbacks = {}
+        self.connected = True
+
+    def kline_stream(self, interval, symbol, callback):
+        symbols = [symbol] if isinstance(symbol, str) else symbol
+        if len(symbols) > 10:
+            raise ValueError("Bybit spot: не больше 10 топиков в одном subscribe")
+        for s in symbols:
+            self.callbacks[f"kline.{interval}.{s}"] = callback
+
+    def is_connected(self):
+        return self.connected
+
+    def exit(self):
+        self.connected = False
+        self.exchange.clients.discard(self)
+
+
+class FakeExchange:
+    """
+    speed - во сколько раз время биржи идет быстрее реального
+    (300 - одна 5-минутная свеча в секунду). drop_rate - доля закрывающих
+    сообщений (confirm=true), которые "теряются" по дороге.
+    """
+
+    def __init__(self, symbols, interval=5, speed=300.0, history=300, drop_rate=0.0, seed=0):
+        self.symbols = list(symbols)
+        self.interval = int(interval)
+        self.interval_ms = self.interval * 60 * 1000
+        self.speed = speed
+        self.drop_rate = drop_rate
+        self.rng = random.Random(seed)
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.running = False
+
+        now_ms = int(time.time() * 1000)
+        self.start_ms = now_ms - now_ms % self.interval_ms
+        self.started = time.monotonic()
+        self.candles = {}
+        self.forming = {}
+        for symbol in self.symbols:
+            price = self.rng.uniform(0.01, 1000)
+            history_candles = []
+            for i in range(history, 0, -1):
+                candle = self._next_candle(self.start_ms - i * self.interval_ms, price)
+                price = candle[4]
+                history_candles.append(candle)
+            self.candles[symbol] = history_candles
+            self.forming[symbol] = self._next_candle(self.start_ms, price)
+
+    def _next_candle(self, ts, open_price):
+        close = open_price * (1 + self.rng.gauss(0, 0.01))
+        high = max(open_price, close) * (1 + abs(self.rng.gauss(0, 0.003)))
+        low = min(open_price, close) * (1 - abs(self.rng.gauss(0, 0.003)))
+        volume = self.rng.uniform(100, 10000)
+        return [ts, open_price, high, low, close, volume, volume * close]
+
+    def now(self):
+        """Текущее время биржи в секундах (подставляется как clock в KlineStream)."""
+        return self.start_ms / 1000 + (time.monotonic() - self.started) * self.speed
+
+    # --- REST ---
+
+    def get_kline(self, symbol, timeframe='5', limit=200):
+        """Аналог main.fetch_klines: строки, новые первыми, первая - незакрытая."""
+        with self.lock:
+            rows = self.candles[symbol][-(limit - 1):] + [self.forming[symbol]]
+        return [[str(v) for v in candle] for candle in reversed(rows)]
+
+    # --- WebSocket ---
+
+    def connect(self):
+        client = FakeWebSocket(self)
+        with self.lock:
+            self.clients.add(client)
+        return client
+
+    def disconnect_all(self):
+        """Имитирует обрыв: клиенты перестают получать сообщения."""
+        with self.lock:
+            for client in list(self.clients):
+                client.connected = False
+            self.clients.clear()
+
+    def _message(self, symbol, candle, confirm):
+        ts, o, h, l, c, v, t = candle
+        return {
+            "topic": f"kline.{self.interval}.{symbol}",
+            "type": "snapshot",
+            "ts": int(self.now() * 1000),
+            "data": [{
+                "start": ts, "end": ts + self.interval_ms - 1, "interval": str(self.interval),
+                "open": str(o), "close": str(c), "high": str(h), "low": str(l),
+                "volume": str(v), "turnover": str(t), "confirm": confirm,
+                "timestamp": int(self.now() * 1000),
+            }],
+        }
+
+    def _publish(self, symbol, candle, confirm):
+        topic = f"kline.{self.interval}.{symbol}"
+        message = self._message(symbol, candle, confirm)
+        for client in list(self.clients):
+            callback = client.callbacks.get(topic)
+            if client.connected and callback:
+                callback(message)
+
+    def tick(self):
+        """Один шаг: обновляет незакрытые свечи и закрывает те, чье время вышло."""
+        now_ms = int(self.now() * 1000)
+        for symbol in self.symbols:
+            with self.lock:
+                candle = self.forming[symbol]
+                closed = now_ms >= candle[0] + self.interval_ms
+                if closed:
+                    self.candles[symbol].append(candle)
+                    del self.candles[symbol][:-1000]
+                    self.forming[symbol] = self._next_candle(candle[0] + self.interval_ms, candle[4])
+                else:
+                    step = candle[4] * self.rng.gauss(0, 0.001)
+                    candle[4] += step
+                    candle[2] = max(candle[2], candle[4])
+                    candle[3] = min(candle[3], candle[4])
+            if closed and self.rng.random() < self.drop_rate:
+                continue
+            self._publish(symbol, candle, closed)
+
+    def run(self, tick_sec=0.05):
+        self.running = True
+
+        def loop():
+            while self.running:
+                self.tick()
+                time.sleep(tick_sec)
+
+        threading.Thread(target=loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+
+def main():
+    from ws_stream import KlineStream
+
+    symbols = config.my_symbols[:50]
+    exchange = FakeExchange(symbols, speed=300.0, drop_rate=0.05)
+    exchange.run()
+
+    signals = []
+
+    def on_signal(df, symbol, timeframe=None):
+        signals.append((symbol, df.index[-2]))
+
+    stream = KlineStream(symbols, ws_factory=exchange.connect, fetch_fn=exchange.get_kline,
+                         clock=exchange.now, on_signal=on_signal)
+    stream.start()
+    deadline = time.monotonic() + 20
+    dropped = False
+    while time.monotonic() < deadline:
+        time.sleep(0.2)
+        if not dropped and time.monotonic() > deadline - 10:
+            print("Имитация обрыва соединений...")
+            exchange.disconnect_all()
+            for conn in stream.connections:
+                conn['last_msg'] -= config.WS_STALE_AFTER
+            dropped = True
+        stream.watchdog()
+    stream.stop()
+    exchange.stop()
+
+    lagging = [s for s, b in stream.buffers.items() if b.last_ts is None or
+               b.last_ts < exchange.candles[s][-1][0]]
+    print(f"Проверок сигнала: {len(signals)}, символов с отставанием: {len(lagging)}")
+
+
+if __name__ == "__main__":
+    main()
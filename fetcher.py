@@ -0,0 +1,122 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+import metrics
+
+# Коды Bybit, при которых запрос имеет смысл повторить:
+# 10002 - рассинхрон времени, 10006 - превышен лимит запросов,
+# 10016 - внутренняя ошибка сервера, 10429 - системная защита от частых запросов
+RETRY_CODES = {10002, 10006, 10016, 10429}
+
+
+class RateLimiter:
+    """
+    Потокобезопасный token bucket: не больше `rate` запросов в секунду
+    с допустимым всплеском до `burst` запросов.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """Берет токен без ожидания. Возвращает 0, если взят, иначе - сколько ждать."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class RetryableError(Exception):
+    """Ответ API, который стоит повторить (см. RETRY_CODES)."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def configure_session(session):
+    """
+    Отключает повторы внутри pybit: с настройками по умолчанию он сам спит
+    и повторяет запрос при 10002/10006, мимо ограничителя и без учета в
+    метриках. Теперь эти ответы доходят до request_with_retry().
+    """
+    session.max_retries = 1
+    # пустой набор задаем после создания: в конструкторе он заменяется на набор по умолчанию
+    session.retry_codes = set()
+    session.ignore_codes = set(session.ignore_codes) | RETRY_CODES
+    return session
+
+
+def _error_code(exc):
+    # pybit кладет retCode (или HTTP-статус) в атрибут status_code
+    return getattr(exc, 'status_code', None)
+
+
+def request_with_retry(call, limiter=None, max_retries=3, backoff=0.5):
+    """
+    Выполняет `call()` (запрос к API Bybit) с ограничением частоты и
+    повтором с экспоненциальной задержкой при временных ошибках.
+    Возвращает ответ API, при неисправимой ошибке пробрасывает исключение.
+    """
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            with metrics.timer('http'):
+                response = call()
+            ret_code = response.get('retCode')
+            if ret_code in RETRY_CODES:
+                raise RetryableError(f"retCode={ret_code}: {response.get('retMsg')}", ret_code)
+            return response
+        except Exception as e:
+            code = _error_code(e)
+            retryable = (
+                isinstance(e, (RetryableError, ConnectionError, TimeoutError,
+                               requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+                or code in RETRY_CODES
+                # HTTP 5xx от шлюза; 403 (бан IP) и прочие ошибки не повторяем
+                or (isinstance(code, int) and 500 <= code < 600)
+            )
+            metrics.inc('api_errors_total', code=code if code is not None else e.__class__.__name__)
+            if not retryable or attempt >= max_retries:
+                raise
+            metrics.inc('api_retries_total')
+            time.sleep(backoff * (2 ** attempt))
+            attempt += 1
+
+
+def fetch_all(symbols, fetch_fn, max_workers=16):
+    """
+    Параллельно вызывает `fetch_fn(symbol)` для всех символов в пуле потоков.
+    Возвращает словарь {symbol: результат} в исходном порядке символов.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fetch_fn, symbol): symbol for symbol in symbols}
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                results[symbol] = future.result()
+            except Exception as e:
+                print(f"Ошибка при получении данных для {symbol}: {e}")
+                results[symbol] = None
+    return {symbol: results[symbol] for symbol in symbols}
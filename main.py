@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import pandas_ta as ta
 from pybit.unified_trading import HTTP
@@ -5,39 +6,73 @@ import time
 import pytz
 from datetime import datetime
 
+import config
+import events
+import metrics
+from fetcher import RateLimiter, configure_session, request_with_retry, fetch_all
+from candle_buffer import CandleBuffer, parse_row
+from candle_store import CandleStore
+from vector_engine import MIN_BARS, batch_frames, scan_frames
+from scheduler import CandleScheduler
+from universe import UniverseManager
+from timeframes import MultiTimeframe, Confluence
+
 # Настройте сессию с Bybit
-session = HTTP(testnet=False)
+session = configure_session(HTTP(testnet=False))
+if config.BYBIT_ENDPOINT:
+    session.endpoint = config.BYBIT_ENDPOINT
+# Общий на все потоки ограничитель частоты запросов
+limiter = RateLimiter(config.RATE_LIMIT_PER_SEC, config.RATE_LIMIT_BURST)
 
-def get_historical_data(symbol, timeframe='5', limit=200):
+def fetch_klines(symbol, timeframe='5', limit=200):
     """
-    Получает исторические данные для символа, рассчитывает MACD и 
-    конвертирует время в екатеринбургское.
+    Запрашивает свечи у Bybit (с ограничением частоты и повторами).
+    Возвращает список свечей в формате API (новые первыми) или None.
     """
-    try:
-        response = session.get_kline(
+    response = request_with_retry(
+        lambda: session.get_kline(
             category="spot", 
             symbol=symbol,
             interval=timeframe,
             limit=limit
-        )
+        ),
+        limiter=limiter,
+        max_retries=config.MAX_RETRIES,
+        backoff=config.RETRY_BACKOFF,
+    )
 
-        if response['retCode'] == 0 and response['result']['list']:
-            data = response['result']['list']
-            df = pd.DataFrame(data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover'])
-            
-            for col in df.columns:
-                df[col] = pd.to_numeric(df[col])
+    if response['retCode'] == 0 and response['result']['list']:
+        return response['result']['list']
+    return None
 
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df = df.set_index('timestamp')
-            
-            df.sort_index(ascending=True, inplace=True)
-            
-            df.ta.macd(close='close', fast=12, slow=26, signal=9, append=True)
+def get_historical_data(symbol, timeframe='5', limit=200):
+    """
+    Получает исторические данные для символа, рассчитывает MACD и 
+    конвертирует время в екатеринбургское.
+    """
+    try:
+        data = fetch_klines(symbol, timeframe, limit)
+
+        if data:
+            metrics.inc('candles_processed_total', len(data))
+            with metrics.timer('parse'):
+                df = pd.DataFrame(data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover'])
+                
+                for col in df.columns:
+                    df[col] = pd.to_numeric(df[col])
+
+                df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+                df = df.set_index('timestamp')
+                
+                df.sort_index(ascending=True, inplace=True)
             
-            df.dropna(inplace=True)
+            with metrics.timer('macd'):
+                df.ta.macd(close='close', fast=12, slow=26, signal=9, append=True)
             
-            df.index = df.index.tz_localize('UTC').tz_convert('Asia/Yekaterinburg')
+            with metrics.timer('parse'):
+                df.dropna(inplace=True)
+                
+                df.index = df.index.tz_localize('UTC').tz_convert('Asia/Yekaterinburg')
             
             return df
         else:
@@ -46,149 +81,308 @@ def get_historical_data(symbol, timeframe='5', limit=200):
         print(f"Ошибка при получении данных для {symbol}: {e}")
         return None
 
-def check_entry_signal(df, symbol):
-    if len(df) < 61: 
-        return
+def get_candles(symbol, timeframe='5', limit=200):
+    """
+    Полный путь для пакетного движка: свечи символа массивом (n, 7) в
+    порядке COLUMNS, без DataFrame и MACD - MACD сразу для всех символов
+    считает batch_frames() в check_loaded().
+    """
+    try:
+        data = fetch_klines(symbol, timeframe, limit)
+        if not data:
+            return None
+        metrics.inc('candles_processed_total', len(data))
+        with metrics.timer('parse'):
+            return np.array(sorted(parse_row(r) for r in data))
+    except Exception as e:
+        print(f"Ошибка при получении данных для {symbol}: {e}")
+        return None
+
+# Буферы свечей по символам для инкрементального обновления
+buffers = {}
+# Закрытые свечи на диске: после перезапуска докачивается только пропуск
+store = CandleStore(config.CANDLE_STORE_DIR) if config.CANDLE_STORE_DIR else None
+# Старшие таймфреймы по символам - собираются из тех же свечей, без запросов
+timeframes = {}
+
+def get_buffered_data(symbol, timeframe='5'):
+    """
+    То же, что get_historical_data(), но докачивает только новые свечи
+    в буфер символа и обновляет MACD потоково. Возвращает сам CandleBuffer:
+    пакетный движок читает его массивы, а DataFrame строится (as_frame)
+    только для проверяемых символов.
+    """
+    buffer = buffers.get(symbol)
+    try:
+        if buffer is None:
+            buffer = CandleBuffer(symbol, timeframe, config.CANDLE_HISTORY)
+            if store is not None:
+                buffer.load(store.read(symbol, timeframe, buffer.size))
+            buffer = buffers.setdefault(symbol, buffer)
+
+        def fetch(limit):
+            data = fetch_klines(symbol, timeframe, limit)
+            if data:
+                metrics.inc('candles_processed_total', len(data))
+            return data
+
+        if not buffer.refresh(fetch, int(time.time() * 1000)):
+            return None
+        if store is not None:
+            store.sync(symbol, timeframe, buffer)
+        if config.TIMEFRAMES:
+            sync_timeframes(symbol, timeframe, buffer)
+        return buffer
+    except Exception as e:
+        print(f"Ошибка при получении данных для {symbol}: {e}")
+        return None
+
+def as_frame(data):
+    """DataFrame из кадра, CandleBuffer или FrameArrays."""
+    if isinstance(data, pd.DataFrame):
+        return data
+    with metrics.timer('parse'):
+        return data.to_frame()
+
+def last_closed(data):
+    """(время, гистограмма, close) последней закрытой свечи - строки iloc[-2] кадра."""
+    if isinstance(data, pd.DataFrame):
+        return data.index[-2], data['MACDh_12_26_9'].iloc[-2], data['close'].iloc[-2]
+    arrays = data.arrays(['timestamp', 'MACDh_12_26_9', 'close'])
+    return int(arrays['timestamp'][-2]), float(arrays['MACDh_12_26_9'][-2]), float(arrays['close'][-2])
+
+def sync_timeframes(symbol, base, buffer):
+    """Дописывает новые закрытые свечи буфера символа в его старшие таймфреймы."""
+    mtf = timeframes.get(symbol)
+    if mtf is None:
+        mtf = MultiTimeframe(symbol, config.TIMEFRAMES, base, config.MTF_HISTORY)
+        if store is not None:
+            mtf.load(store)
+        timeframes[symbol] = mtf
+    mtf.sync(buffer)
+
+def get_timeframe_buffers(symbols, is_new, mtfs=None):
+    """
+    Буферы старших таймфреймов {таймфрейм: {символ: CandleBuffer}} - только
+    по символам, у которых на этом таймфрейме закрылась новая свеча и уже
+    накоплено MIN_BARS свечей с MACD (пока таймфрейм прогревается, кадр
+    короче и проверять в нем нечего). mtfs - {символ: MultiTimeframe},
+    по умолчанию - таймфреймы опроса (timeframes).
+    """
+    mtfs = timeframes if mtfs is None else mtfs
+    result = {tf: {} for tf in map(str, config.TIMEFRAMES)}
+    for symbol in symbols:
+        mtf = mtfs.get(symbol)
+        if mtf is None:
+            continue
+        for tf, tf_buffer in mtf.buffers.items():
+            if tf_buffer.last_ts is not None and is_new((symbol, tf), tf_buffer.last_ts):
+                view = tf_buffer.view()
+                if len(view) >= MIN_BARS:
+                    result[tf][symbol] = view
+    return result
+
+def check_entry_signal(df, symbol, timeframe=None, fast=12, slow=26, signal=9,
+                       recent=10, lookback=50, guard=50, min_price_diff=3.0):
+    """
+    timeframe - для старших таймфреймов (попадает в события), None - основной.
+    Остальное - параметры правила (по умолчанию - боевые, их перебирает
+    backtest.py): MACD(fast, slow, signal), recent закрытых свечей для
+    поиска свечи 1, lookback свечей перед ней для свечи 2, guard - сколько
+    свечей кадра должно быть до свечи 1, min_price_diff - разница минимумов, %.
+    """
+    column = f'MACDh_{fast}_{slow}_{signal}'
+    if len(df) < guard + recent + 1: 
+        return False
 
     # <<< ИЗМЕНЕНИЕ 1: Работаем с ГИСТОГРАММОЙ для сигнала входа >>>
     # Используем колонку 'MACDh_12_26_9' - это и есть гистограмма
-    last_closed_histogram = df['MACDh_12_26_9'].iloc[-2]
-    prev_histogram = df['MACDh_12_26_9'].iloc[-3]
+    last_closed_histogram = df[column].iloc[-2]
+    prev_histogram = df[column].iloc[-3]
 
     # Условие "гистограмма пересекла ноль снизу вверх"
     if prev_histogram < 0 and last_closed_histogram > 0:
-        print(f"[{symbol}] !!! СИГНАЛ: Гистограмма пересекла ноль. Ищу дивергенцию...")
-        print(df)
-        print(f"  Свеча 01 ({last_closed_histogram})")
-        print(f"  Свеча 02 ({prev_histogram})")
-        last_10_candles = df.iloc[-12:-2] 
-        neg_macd_10 = last_10_candles[last_10_candles['MACDh_12_26_9'] < 0]
+        metrics.inc('signals_total', kind='cross')
+        events.emit('zero_cross', symbol=symbol, timeframe=timeframe, time=df.index[-2].strftime('%Y-%m-%d %H:%M'),
+                    hist=float(last_closed_histogram), prev_hist=float(prev_histogram))
+        if config.DEBUG_FRAME_DUMP:
+            print(df)
+        last_10_candles = df.iloc[-recent - 2:-2] 
+        neg_macd_10 = last_10_candles[last_10_candles[column] < 0]
 
         if neg_macd_10.empty:
-            print(f"[{symbol}] Поиск дивергенции прерван: не найдено отрицательных MACD в последних 10 свечах.")
-            return
+            events.emit('divergence_aborted', symbol=symbol, timeframe=timeframe,
+                        time=df.index[-2].strftime('%Y-%m-%d %H:%M'),
+                        reason=f"не найдено отрицательных MACD в последних {recent} свечах")
+            return False
 
-        candle1_index = neg_macd_10['MACDh_12_26_9'].idxmin()
+        candle1_index = neg_macd_10[column].idxmin()
         candle1 = df.loc[candle1_index]
-        macd1 = candle1['MACDh_12_26_9'] # Берем значение ЛИНИИ
+        macd1 = candle1[column] # Берем значение ЛИНИИ
         low1 = candle1['low']
         
         candle1_loc = df.index.get_loc(candle1_index)
-        if candle1_loc < 50:
-            return
+        if candle1_loc < guard:
+            return False
         
-        prev_50_candles = df.iloc[candle1_loc - 50 : candle1_loc]
-        neg_macd_50 = prev_50_candles[prev_50_candles['MACDh_12_26_9'] < 0]
+        prev_50_candles = df.iloc[max(0, candle1_loc - lookback) : candle1_loc]
+        neg_macd_50 = prev_50_candles[prev_50_candles[column] < 0]
 
         if neg_macd_50.empty:
-            print(f"[{symbol}] Поиск дивергенции прерван: не найдено отрицательных MACD в предыдущих 50 свечах.")
-            return
+            events.emit('divergence_aborted', symbol=symbol, timeframe=timeframe,
+                        time=df.index[-2].strftime('%Y-%m-%d %H:%M'),
+                        reason=f"не найдено отрицательных MACD в предыдущих {lookback} свечах")
+            return False
 
-        candle2_index = neg_macd_50['MACDh_12_26_9'].idxmin()
+        candle2_index = neg_macd_50[column].idxmin()
         candle2 = df.loc[candle2_index]
-        macd2 = candle2['MACDh_12_26_9'] # Берем значение ЛИНИИ
+        macd2 = candle2[column] # Берем значение ЛИНИИ
         low2 = candle2['low']
 
         price_diff_percent = ((low2 - low1) / low2) * 100
         
-        print(f"[{symbol}] Кандидат на дивергенцию:")
-        print(f"  Свеча 1 ({candle1.name.strftime('%Y-%m-%d %H:%M')}): MACD={macd1:.8f}, Low={low1}")
-        print(f"  Свеча 2 ({candle2.name.strftime('%Y-%m-%d %H:%M')}): MACD={macd2:.8f}, Low={low2}")
-        print(f"  Условия: MACD1 > MACD2 ({macd1 > macd2}), Low1 < Low2 ({low1 < low2}), Разница цен > 3% ({price_diff_percent:.2f}%)")
+        metrics.inc('signals_total', kind='candidate')
+        events.emit(
+            'divergence_candidate', symbol=symbol, timeframe=timeframe,
+            time=df.index[-2].strftime('%Y-%m-%d %H:%M'),
+            candle1={'time': candle1.name.strftime('%Y-%m-%d %H:%M'), 'macd': float(macd1), 'low': float(low1)},
+            candle2={'time': candle2.name.strftime('%Y-%m-%d %H:%M'), 'macd': float(macd2), 'low': float(low2)},
+            price_diff=float(price_diff_percent), min_price_diff=min_price_diff,
+            conditions={'macd1_gt_macd2': bool(macd1 > macd2), 'low1_lt_low2': bool(low1 < low2),
+                        'price_diff_gt_min': bool(price_diff_percent > min_price_diff)},
+        )
         
-        if macd1 > macd2 and low1 < low2 and price_diff_percent > 3.0:
-            print("="*50)
-            print(f"!!! НАЙДЕНА ТОЧКА ВХОДА В ЛОНГ ДЛЯ {symbol} !!!")
-            print(f"Время сигнала (ЕКБ): {df.index[-2].strftime('%Y-%m-%d %H:%M:%S')}")
-            print(f"Цена входа (Close): {df['close'].iloc[-2]}")
-            print("="*50)
+        if macd1 > macd2 and low1 < low2 and price_diff_percent > min_price_diff:
+            metrics.inc('signals_total', kind='entry')
+            # Начало незакрытой свечи = закрытие свечи сигнала
+            metrics.observe('signal_lag_seconds', time.time() - df.index[-1].timestamp(), metrics.LAG_BUCKETS)
+            events.emit('long_entry', symbol=symbol, timeframe=timeframe, time=df.index[-2].strftime('%Y-%m-%d %H:%M:%S'),
+                        close=float(df['close'].iloc[-2]))
+            return True
+    return False
+
+def make_confluence(buffered=None):
+    """
+    Отслеживание совпадений по таймфреймам, если оно включено (MTF_MODE='confluence').
+    buffered - работают ли буферы свечей (по умолчанию USE_CANDLE_BUFFER).
+    """
+    if buffered is None:
+        buffered = config.USE_CANDLE_BUFFER
+    # Старшие таймфреймы собираются из буферов, без буферов их нет
+    if config.TIMEFRAMES and buffered and config.MTF_MODE == 'confluence':
+        return Confluence(['5'] + list(config.TIMEFRAMES), config.MTF_CONFLUENCE_WINDOW)
+    return None
+
+def confirm_entry(confluence, df, symbol, timeframe):
+    """Вход на таймфрейме timeframe - в Confluence; при совпадении на всех - событие."""
+    if confluence.add(symbol, timeframe, df.index[-1].timestamp()):
+        events.emit('confluence_entry', symbol=symbol, timeframes=sorted(confluence.timeframes, key=int),
+                    time=df.index[-2].strftime('%Y-%m-%d %H:%M:%S'), close=float(df['close'].iloc[-2]))
+
+def scan_symbols(symbols, scheduler, last_hist, confluence=None):
+    """
+    Один проход по symbols (в порядке проверки): параллельная загрузка свечей
+    до дедлайна scheduler и проверка сигналов по каждой новой закрытой свече,
+    в том числе на старших таймфреймах. last_hist обновляется для
+    scheduler.prioritize(). Возвращает число символов, не успевших к дедлайну.
+    """
+    if config.USE_CANDLE_BUFFER:
+        get_data = get_buffered_data
+    elif config.USE_BATCH_ENGINE:
+        get_data = get_candles
+    else:
+        get_data = get_historical_data
+    skipped = set()
+
+    def get_data_until_deadline(symbol):
+        if scheduler.expired():
+            skipped.add(symbol)
+            return None
+        return get_data(symbol)
+
+    loaded = fetch_all(symbols, get_data_until_deadline, max_workers=config.MAX_WORKERS)
+    check_loaded(loaded, scheduler.is_new, last_hist, confluence)
+    return len(skipped)
+
+def check_loaded(loaded, is_new, last_hist, confluence=None):
+    """
+    Проверка сигналов по результатам get_data {символ: данные}: кадры
+    get_historical_data, буферы get_buffered_data или свечи get_candles
+    (для них MACD всех символов считается здесь одним проходом).
+    """
+    candles = {s: data for s, data in loaded.items() if isinstance(data, np.ndarray)}
+    if candles:
+        with metrics.timer('macd'):
+            loaded = dict(loaded, **batch_frames(candles))
+    # Свежий листинг дает кадр из 1-2 строк - закрытой свечи с предыдущей для проверки еще нет
+    loaded = {s: data for s, data in loaded.items() if data is not None and len(data) >= 3}
+    new = {}
+    for symbol, data in loaded.items():
+        bar_ts, hist, close = last_closed(data)
+        last_hist[symbol] = (hist, close)
+        # Каждую закрытую свечу проверяем один раз
+        if is_new(symbol, bar_ts):
+            new[symbol] = data
+    checks = {None: new}
+    if config.TIMEFRAMES and config.USE_CANDLE_BUFFER:
+        checks.update(get_timeframe_buffers(loaded, is_new))
+    for timeframe, tf_data in checks.items():
+        if config.USE_BATCH_ENGINE:
+            # Пересечение нуля ищем сразу по всем символам (по массивам, без DataFrame),
+            # кадр и подробный разбор - только по найденным
+            with metrics.timer('signal'):
+                crossed = {r['symbol'] for r in scan_frames(tf_data)}
+            tf_data = {s: data for s, data in tf_data.items() if s in crossed}
+        for symbol, data in tf_data.items():
+            df = as_frame(data)
+            with metrics.timer('signal'):
+                entry = check_entry_signal(df, symbol, timeframe)
+            if entry and confluence is not None:
+                confirm_entry(confluence, df, symbol, timeframe or '5')
+
+def start_services(auto_refresh=True):
+    """
+    Общий запуск для main(), ws_stream.py и shard.py: вывод событий, метрики
+    и список токенов. auto_refresh=False - список берется с биржи один раз,
+    без обновления в фоне. Возвращает UniverseManager.
+    """
+    events.configure_from_config(config)
+    if config.METRICS_ENABLED:
+        metrics.start(config.METRICS_PORT, config.METRICS_SUMMARY_SEC, config.METRICS_SUMMARY_PATH)
+    universe = UniverseManager(
+        session, limiter, fallback=config.my_symbols, quote=config.UNIVERSE_QUOTE,
+        min_turnover=config.UNIVERSE_MIN_TURNOVER_24H, max_spread=config.UNIVERSE_MAX_SPREAD_PCT,
+        illiquid=config.UNIVERSE_ILLIQUID, refresh_sec=config.UNIVERSE_REFRESH_SEC,
+    )
+    if config.UNIVERSE_AUTO_REFRESH:
+        if auto_refresh:
+            universe.start()
+        else:
+            universe.refresh()
+    print(f"Будет отслеживаться {len(universe.symbols())} токенов.")
+    return universe
 
 def main():
     print("Запуск торгового робота...")
-    my_symbols = [
-    '0GUSDT', '1INCHUSDT', '2ZUSDT', 'A8USDT', 'AAPLXUSDT', 'AAVEUSDT', 'ACHUSDT', 'ACSUSDT',
-    'ADAUSDT', 'AEROUSDT', 'AEVOUSDT', 'AFCUSDT', 'AFGUSDT', 'AGIUSDT', 'AGLDUSDT', 'AI16ZUSDT',
-    'AIOZUSDT', 'AIXBTUSDT', 'AKIUSDT', 'ALCHUSDT', 'ALGOUSDT', 'ALTUSDT', 'AMIUSDT', 'AMZNXUSDT',
-    'ANIMEUSDT', 'ANKRUSDT', 'AOUSDT', 'APEUSDT', 'APEXUSDT', 'APPUSDT', 'APTUSDT', 'ARBUSDT',
-    'ARKMUSDT', 'ARTUSDT', 'ARTYUSDT', 'ARUSDT', 'ASRRUSDT', 'ASTERUSDT', 'ATHUSDT', 'ATOMUSDT',
-    'AURORAUSDT', 'AUSDT', 'AVAILUSDT', 'AVAUSDT', 'AVAXUSDT', 'AVLUSDT', 'AVNTUSDT', 'AXLUSDT',
-    'AXSUSDT', 'B3TRUSDT', 'B3USDT', 'BABY1USDT', 'BABYDOGEUSDT', 'BANUSDT', 'BARDUSDT', 'BATUSDT',
-    'BBSOLUSDT', 'BBUSDT', 'BCHUSDT', 'BCUTUSDT', 'BDXNUSDT', 'BEAMUSDT', 'BELUSDT', 'BERAUSDT',
-    'BICOUSDT', 'BLASTUSDT', 'BLURUSDT', 'BMTUSDT', 'BNBUSDT', 'BOBAUSDT', 'BOMBUSDT', 'BOMEUSDT',
-    'BONKUSDT', 'BRETTUSDT', 'BRUSDT', 'BTCUSDT', 'BTTUSDT', 'C98USDT', 'CAKEUSDT', 'CAMPUSDT',
-    'CARVUSDT', 'CATIUSDT', 'CATUSDT', 'CBKUSDT', 'CELOUSDT', 'CFGUSDT', 'CGPTUSDT', 'CHILLGUYUSDT',
-    'CHZUSDT', 'CITYUSDT', 'CLOUDUSDT', 'CMETHUSDT', 'COAUSDT', 'COINXUSDT', 'COMMONUSDT', 'COMPUSDT',
-    'COOKIEUSDT', 'COOKUSDT', 'COQUSDT', 'COREUSDT', 'CORNUSDT', 'CPOOLUSDT', 'CRCLXUSDT', 'CRVUSDT',
-    'CSPRUSDT', 'CTAUSDT', 'CTCUSDT', 'CUDISUSDT', 'CYBERUSDT', 'DAIUSDT', 'DBRUSDT', 'DEEPUSDT',
-    'DEFIUSDT', 'DEGENUSDT', 'DGBUSDT', 'DIAMUSDT', 'DMAILUSDT', 'DOGEUSDT', 'DOGSUSDT', 'DOLOUSDT',
-    'DOMEUSDT', 'DOODUSDT', 'DOTUSDT', 'DRIFTUSDT', 'DUELUSDT', 'DYDXUSDT', 'DYMUSDT', 'EATUSDT',
-    'EGLDUSDT', 'EGP1USDT', 'EIGENUSDT', 'ELDEUSDT', 'ELXUSDT', 'ENAUSDT', 'ENJUSDT', 'ENSOUSDT',
-    'ENSUSDT', 'EPTUSDT', 'ERAUSDT', 'ESEUSDT', 'ESUSDT', 'ETCUSDT', 'ETHFIUSDT', 'ETHUSDT',
-    'ETHWUSDT', 'EVERUSDT', 'FETUSDT', 'FFUSDT', 'FHEUSDT', 'FIDAUSDT', 'FILUSDT', 'FITFIUSDT',
-    'FLIPUSDT', 'FLOCKUSDT', 'FLOKIUSDT', 'FLOWUSDT', 'FLRUSDT', 'FLUIDUSDT', 'FORTUSDT', 'FOXYUSDT',
-    'FRAGUSDT', 'FTTUSDT', 'FUELUSDT', 'FUSDT', 'FXSUSDT', 'G3USDT', 'G7USDT', 'GALAUSDT',
-    'GALFTUSDT', 'GAMEUSDT', 'GLMRUSDT', 'GMTUSDT', 'GMXUSDT', 'GOATUSDT', 'GODSUSDT', 'GOOGLXUSDT',
-    'GPSUSDT', 'GRASSUSDT', 'GRTUSDT', 'GSWIFTUSDT', 'GTAIUSDT', 'GUSDT', 'HAEDALUSDT', 'HBARUSDT',
-    'HFTUSDT', 'HMSTRUSDT', 'HNTUSDT', 'HOLOUSDT', 'HOMEUSDT', 'HOODXUSDT', 'HOOKUSDT', 'HPOS10IUSDT',
-    'HTXUSDT', 'HUMAUSDT', 'HUSDT', 'HYPERUSDT', 'HYPEUSDT', 'ICNTUSDT', 'ICPUSDT', 'ICXUSDT',
-    'IDUSDT', 'IMXUSDT', 'INITUSDT', 'INJUSDT', 'INSPUSDT', 'INTERUSDT', 'IOUSDT', 'IPUSDT',
-    'IZIUSDT', 'JASMYUSDT', 'JEFFUSDT', 'JSTUSDT', 'JTOUSDT', 'JUPUSDT', 'JUSDT', 'JUVUSDT',
-    'KAIAUSDT', 'KASTAUSDT', 'KASUSDT', 'KAVAUSDT', 'KCSUSDT', 'KILOUSDT', 'KMNOUSDT', 'KSMUSDT',
-    'KUBUSDT', 'KUSDT', 'L3USDT', 'LADYSUSDT', 'LAUSDT', 'LAVAUSDT', 'LAYERUSDT', 'LBTCUSDT',
-    'LDOUSDT', 'LFTUSDT', 'LINEAUSDT', 'LINKUSDT', 'LLUSDT', 'LMWRUSDT', 'LOOKSUSDT', 'LRCUSDT',
-    'LTCUSDT', 'LUNAIUSDT', 'LUNAUSDT', 'LUNCUSDT', 'MAGICUSDT', 'MAJORUSDT', 'MANAUSDT', 'MANTAUSDT',
-    'MASAUSDT', 'MASKUSDT', 'MAVIAUSDT', 'MBOXUSDT', 'MBXUSDT', 'MCDXUSDT', 'MCRTUSDT', 'MDAOUSDT',
-    'MEEUSDT', 'MEMEFIUSDT', 'MEMEUSDT', 'MERLUSDT', 'METAXUSDT', 'METHUSDT', 'METUSDT', 'MEUSDT',
-    'MEWUSDT', 'MILKUSDT', 'MINAUSDT', 'MNTUSDT', 'MOCAUSDT', 'MODEUSDT', 'MOGUSDT', 'MONPROUSDT',
-    'MORPHOUSDT', 'MOVEUSDT', 'MOVRUSDT', 'MOZUSDT', 'MPLXUSDT', 'MVLUSDT', 'MVUSDT', 'MXUSDT',
-    'MYRIAUSDT', 'MYROUSDT', 'NAKAUSDT', 'NAVXUSDT', 'NEARUSDT', 'NEIROCTOUSDT', 'NEONUSDT', 'NEWTUSDT',
-    'NEXOUSDT', 'NFTUSDT', 'NIBIUSDT', 'NOMUSDT', 'NOTUSDT', 'NRNUSDT', 'NSUSDT', 'NVDAXUSDT',
-    'NXPCUSDT', 'NYMUSDT', 'OASUSDT', 'OBOLUSDT', 'OBTUSDT', 'ODOSUSDT', 'OIKUSDT', 'OLUSDT',
-    'OMUSDT', 'ONDOUSDT', 'ONEUSDT', 'OPUSDT', 'ORDERUSDT', 'ORDIUSDT', 'ORTUSDT', 'PAALUSDT',
-    'PARTIUSDT', 'PAWSUSDT', 'PELLUSDT', 'PENDLEUSDT', 'PENGUUSDT', 'PEOPLEUSDT', 'PEPEUSDT', 'PERPUSDT',
-    'PINEYEUSDT', 'PIRATEUSDT', 'PIXFIUSDT', 'PLUMEUSDT', 'PNUTUSDT', 'POLUSDT', 'PONKEUSDT', 'POPCATUSDT',
-    'PORT3USDT', 'PORTALSUSDT', 'PORTALUSDT', 'PRCLUSDT', 'PRIMEUSDT', 'PROVEUSDT', 'PSGUSDT', 'PSTAKEUSDT',
-    'PUFFERUSDT', 'PUFFUSDT', 'PUMPBTCUSDT', 'PUMPUSDT', 'PURSEUSDT', 'PYTHUSDT', 'PYUSDUSDT', 'QNTUSDT',
-    'QORPOUSDT', 'QTUMUSDT', 'RACAUSDT', 'RATSUSDT', 'RDNTUSDT', 'RECALLUSDT', 'REDUSDT', 'RENDERUSDT',
-    'RESOLVUSDT', 'RLUSDUSDT', 'ROAMUSDT', 'ROOTUSDT', 'ROSEUSDT', 'RPLUSDT', 'RSS3USDT', 'RUNEUSDT',
-    'RVNUSDT', 'SAFEUSDT', 'SAHARAUSDT', 'SANDUSDT', 'SAROSUSDT', 'SATSUSDT', 'SCAUSDT', 'SCRTUSDT',
-    'SCRUSDT', 'SCUSDT', 'SDUSDT', 'SEIUSDT', 'SENDUSDT', 'SERAPHUSDT', 'SFUNDUSDT', 'SHARDSUSDT',
-    'SHIBUSDT', 'SHRAPUSDT', 'SIDUSUSDT', 'SIGNUSDT', 'SISUSDT', 'SKATEUSDT', 'SKYUSDT', 'SLPUSDT',
-    'SNXUSDT', 'SOLOUSDT', 'SOLUSDT', 'SOLVUSDT', 'SOMIUSDT', 'SONICUSDT', 'SOSOUSDT', 'SPECUSDT',
-    'SPELLUSDT', 'SPKUSDT', 'SPXUSDT', 'SQDUSDT', 'SQRUSDT', 'SQTUSDT', 'SSVUSDT', 'STETHUSDT',
-    'STOPUSDT', 'STREAMUSDT', 'STRKUSDT', 'STXUSDT', 'SUIUSDT', 'SUNDOGUSDT', 'SUNUSDT', 'SUPRAUSDT',
-    'SUSDT', 'SUSHIUSDT', 'SVLUSDT', 'SWEATUSDT', 'SWELLUSDT', 'SXTUSDT', 'SYNDUSDT', 'TACUSDT',
-    'TAIKOUSDT', 'TAIUSDT', 'TAUSDT', 'TELUSDT', 'THETAUSDT', 'TIAUSDT', 'TIMEUSDT', 'TNSRUSDT',
-    'TOKENUSDT', 'TONUSDT', 'TOSHIUSDT', 'TOWNSUSDT', 'TRCUSDT', 'TREEUSDT', 'TRUMPUSDT', 'TRVLUSDT',
-    'TRXUSDT', 'TSLAXUSDT', 'TUNAUSDT', 'TURBOSUSDT', 'TUSDUSDT', 'TWTUSDT', 'ULTIUSDT', 'UMAUSDT',
-    'UNIUSDT', 'USD1USDT', 'USDCUSDT', 'USDDUSDT', 'USDEUSDT', 'USDQUSDT', 'USDRUSDT', 'USDTBUSDT',
-    'USDYUSDT', 'USTCUSDT', 'UUSDT', 'UXLINKUSDT', 'VANAUSDT', 'VANRYUSDT', 'VELOUSDT', 'VENOMUSDT',
-    'VETUSDT', 'VICUSDT', 'VINUUSDT', 'VIRTUALUSDT', 'VRAUSDT', 'VTHOUSDT', 'VVVUSDT', 'WALUSDT',
-    'WAVESUSDT', 'WAXPUSDT', 'WBTCUSDT', 'WCTUSDT', 'WEMIXUSDT', 'WENUSDT', 'WIFUSDT', 'WLDUSDT',
-    'WLFIUSDT', 'WOOUSDT', 'WUSDT', 'XAIUSDT', 'XANUSDT', 'XAUTUSDT', 'XAVAUSDT', 'XCADUSDT',
-    'XDCUSDT', 'XECUSDT', 'XEMUSDT', 'XIONUSDT', 'XLMUSDT', 'XOUSDT', 'XPLUSDT', 'XRPUSDT',
-    'XTERUSDT', 'XTZUSDT', 'XUSDT', 'XUSDUSDT', 'YBUSDT', 'YFIUSDT', 'ZBTUSDT', 'ZENTUSDT',
-    'ZENUSDT', 'ZEREBROUSDT', 'ZEROUSDT', 'ZETAUSDT', 'ZEXUSDT', 'ZIGUSDT', 'ZILUSDT', 'ZKCUSDT',
-    'ZKJUSDT', 'ZKLUSDT', 'ZKUSDT', 'ZORAUSDT', 'ZRCUSDT', 'ZROUSDT', 'ZRXUSDT', 'ZTXUSDT',
-    ]
-    
-    print(f"Будет отслеживаться {len(my_symbols)} токенов.")
-
-    while True:
+    universe = start_services()
+
+    scheduler = CandleScheduler('5', settle=config.SCHEDULE_SETTLE_SEC, deadline=config.SCAN_DEADLINE_SEC)
+    # Гистограмма и цена по последней закрытой свече - для порядка проверки
+    last_hist = {}
+    confluence = make_confluence()
+
+    for _ in scheduler.cycles():
         ekb_tz = pytz.timezone('Asia/Yekaterinburg')
         print(f"\n--- Новая проверка. Время (ЕКБ): {datetime.now(ekb_tz).strftime('%Y-%m-%d %H:%M:%S')} ---")
         
-        for symbol in my_symbols:
-            df = get_historical_data(symbol)
-            if df is not None and not df.empty:
-                check_entry_signal(df, symbol)
-            time.sleep(0.5)
-
-        now = datetime.now()
-        minutes_to_wait = 5 - (now.minute % 5)
-        seconds_to_wait = minutes_to_wait * 60 - now.second
-        print(f"Проверка всех токенов завершена. Жду {seconds_to_wait} секунд до следующей свечи...")
-        time.sleep(5)
+        # Загружаем свечи параллельно, самые вероятные сигналы - первыми,
+        # неликвидные пары (если не отброшены) - последними
+        liquid, low_priority = universe.groups()
+        symbols = scheduler.prioritize(liquid, last_hist) + low_priority
+        skipped = scan_symbols(symbols, scheduler, last_hist, confluence)
+
+        metrics.observe('cycle_seconds', time.time() - scheduler.started)
+        scheduler.report(len(symbols) - skipped, len(symbols))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,301 @@
+"""
+Счетчики и таймеры этапов прохода.
+
+Этапы (метка stage): http - запрос get_kline, parse - разбор ответа и
+построение DataFrame, macd - расчет MACD, signal - проверка сигнала.
+Плюс счетчики ошибок/повторов API, обработанных свечей, найденных
+сигналов и задержка от закрытия свечи до сигнала.
+
+Пока метрики выключены (enable() не вызывался), timer() возвращает
+общий пустой контекст, а inc()/observe() сразу выходят - накладные
+расходы сводятся к одной проверке флага.
+
+Наружу: текст в формате Prometheus (/metrics), JSON-сводка (/summary и
+периодический вывод) и семплирующий профилировщик, который включается
+на ходу: /profile/start, /profile/stop, /profile.
+"""
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LAG_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300)
+
+# Описания для # HELP в /metrics; метрики не из списка выводятся без него
+HELP = {
+    'api_errors_total': 'Ответы API с ошибкой (по retCode/HTTP-коду)',
+    'api_retries_total': 'Повторы запросов к API',
+    'candles_processed_total': 'Полученные свечи',
+    'signals_total': 'Пересечения нуля, кандидаты и точки входа',
+    'shard_duplicates_total': 'Повторные события шардов, отброшенные координатором',
+    'shard_reassigned_total': 'Символы, переданные другому воркеру',
+    'shard_restarts_total': 'Перезапуски воркеров',
+    'stage_seconds': 'Время этапов прохода (http, parse, macd, signal)',
+    'cycle_seconds': 'Время прохода по всем символам',
+    'signal_lag_seconds': 'Задержка от закрытия свечи до сигнала',
+}
+
+enabled = False
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}="{v}"' for k, v in sorted(labels.items())) + '}'
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля по корзинам - верхняя граница нужной корзины."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for i, c in enumerate(self.counts):
+            total += c
+            if total >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+def inc(name, value=1, **labels):
+    if not enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    if not enabled:
+        return
+    key = (name, _key(name, labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+
+class _Timer:
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe('stage_seconds', time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class _NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(stage, **labels):
+    """with metrics.timer('http'): ... - время этапа в гистограмму stage_seconds."""
+    if not enabled:
+        return _NULL_TIMER
+    return _Timer(dict(labels, stage=stage))
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+# --- Вывод ---
+
+def _family(lines, name, kind, emitted):
+    """# HELP и # TYPE - один раз перед первой строкой семейства метрик."""
+    if name in emitted:
+        return
+    emitted.add(name)
+    if name in HELP:
+        lines.append(f"# HELP bot_{name} {HELP[name]}")
+    lines.append(f"# TYPE bot_{name} {kind}")
+
+
+def prometheus_text():
+    lines = []
+    emitted = set()
+    with _lock:
+        for key, value in sorted(_counters.items(), key=lambda item: (item[0].split('{')[0], item[0])):
+            _family(lines, key.split('{')[0], 'counter', emitted)
+            lines.append(f"bot_{key} {value}")
+        for (name, key), h in sorted(_histograms.items()):
+            _family(lines, name, 'histogram', emitted)
+            labels = key[len(name):].strip('{}')
+            sep = ',' if labels else ''
+            cumulative = 0
+            for bound, c in zip(list(h.buckets) + ['+Inf'], h.counts):
+                cumulative += c
+                lines.append(f'bot_{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+            suffix = '{' + labels + '}' if labels else ''
+            lines.append(f"bot_{name}_sum{suffix} {h.sum}")
+            lines.append(f"bot_{name}_count{suffix} {h.count}")
+    return '\n'.join(lines) + '\n'
+
+
+def summary():
+    with _lock:
+        result = {'counters': dict(_counters), 'histograms': {}}
+        for (name, key), h in _histograms.items():
+            result['histograms'][key] = {
+                'count': h.count,
+                'mean': h.sum / h.count if h.count else None,
+                'p50': h.quantile(0.5),
+                'p99': h.quantile(0.99),
+            }
+    return result
+
+
+# --- Профилировщик ---
+
+class SamplingProfiler:
+    """
+    Раз в interval секунд снимает стеки всех потоков (sys._current_frames)
+    и считает, в каких функциях чаще всего оказывается программа.
+    """
+
+    def __init__(self, interval=0.01, depth=3):
+        self.interval = interval
+        self.depth = depth
+        self.samples = Counter()
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.samples.clear()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        me = threading.get_ident()
+        while self.running:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[' <- '.join(stack)] += 1
+            time.sleep(self.interval)
+
+    def report(self, top=20):
+        total = sum(self.samples.values()) or 1
+        return [{'stack': stack, 'share': round(n / total, 4), 'samples': n}
+                for stack, n in self.samples.most_common(top)]
+
+
+profiler = SamplingProfiler()
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body, content_type = prometheus_text(), 'text/plain; version=0.0.4'
+        elif self.path == '/summary':
+            body, content_type = json.dumps(summary(), ensure_ascii=False), 'application/json'
+        elif self.path == '/profile/start':
+            profiler.start()
+            body, content_type = 'profiler started\n', 'text/plain'
+        elif self.path == '/profile/stop':
+            profiler.stop()
+            body, content_type = 'profiler stopped\n', 'text/plain'
+        elif self.path == '/profile':
+            body, content_type = json.dumps(profiler.report(), ensure_ascii=False, indent=1), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port, host='127.0.0.1'):
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_summary_writer(interval_sec, path=None):
+    """Каждые interval_sec секунд пишет JSON-сводку строкой в файл path или в консоль."""
+    def loop():
+        while True:
+            time.sleep(interval_sec)
+            line = json.dumps(dict(summary(), time=time.time()), ensure_ascii=False)
+            if path:
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+            else:
+                print(f"Метрики: {line}")
+
+    threading.Thread(target=loop, daemon=True).start()
+
+
+def start(port=None, summary_sec=None, summary_path=None):
+    """Включает метрики и запускает выбранные способы их вывода."""
+    enable()
+    if port:
+        start_http_server(port)
+    if summary_sec:
+        start_summary_writer(summary_sec, summary_path)
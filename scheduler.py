@@ -0,0 +1,93 @@
+"""
+Планировщик проходов по закрытию свечи.
+
+Проход запускается через settle секунд после закрытия очередной свечи
+(чтобы биржа успела отдать закрытую свечу), ограничен дедлайном - по
+умолчанию закрытием следующей свечи, - и каждая закрытая свеча символа
+проверяется ровно один раз.
+"""
+import time
+from datetime import datetime
+
+
+def next_close(now, interval_sec):
+    """Ближайшая граница свечи строго после now (секунды от эпохи)."""
+    return (int(now) // interval_sec + 1) * interval_sec
+
+
+class CandleScheduler:
+
+    def __init__(self, interval='5', settle=3.0, deadline=None, clock=time.time, sleep=time.sleep):
+        self.interval_sec = int(interval) * 60
+        self.settle = settle
+        self.deadline_sec = deadline
+        self.clock = clock
+        self.sleep = sleep
+        self.evaluated = {}
+        self.started = None
+        self.deadline = None
+        self.skipped = 0    # свечей, пропущенных из-за отставания
+
+    def cycles(self):
+        """
+        Бесконечно выдает (время закрытия свечи, дедлайн прохода).
+        Первый проход - сразу, дальше - по закрытию каждой свечи. Если проход
+        затянулся и следующая свеча уже закрылась, следующий проход начинается
+        сразу; пропускаются (с предупреждением) только свечи, отставшие
+        больше чем на интервал.
+        """
+        now = self.clock()
+        close = next_close(now, self.interval_sec) - self.interval_sec
+        while True:
+            self.started = self.clock()
+            limit = self.deadline_sec if self.deadline_sec is not None else self.interval_sec
+            self.deadline = min(close + limit, close + self.interval_sec)
+            yield close, self.deadline
+            close += self.interval_sec
+            latest = next_close(self.clock(), self.interval_sec) - self.interval_sec
+            if latest > close:
+                missed = (latest - close) // self.interval_sec
+                self.skipped += missed
+                print(f"ВНИМАНИЕ: проход отстал от расписания - пропущено свечей: {missed}.")
+                close = latest
+            wait = close + self.settle - self.clock()
+            if wait > 0:
+                print(f"Жду {wait:.0f} секунд до закрытия следующей свечи...")
+                self.sleep(wait)
+
+    def expired(self):
+        return self.deadline is not None and self.clock() > self.deadline
+
+    def is_new(self, symbol, bar_ts):
+        """True, если закрытая свеча bar_ts символа еще не проверялась."""
+        if self.evaluated.get(symbol) == bar_ts:
+            return False
+        self.evaluated[symbol] = bar_ts
+        return True
+
+    @staticmethod
+    def prioritize(symbols, last_hist):
+        """
+        Порядок проверки: сначала символы с отрицательной гистограммой,
+        близкой к нулю (относительно цены) - у них пересечение вероятнее
+        всего; потом символы без данных; в конце - с положительной.
+        last_hist: {symbol: (гистограмма, close)} по последней закрытой свече.
+        """
+        def key(symbol):
+            if symbol not in last_hist:
+                return (1, 0.0)
+            hist, close = last_hist[symbol]
+            score = abs(hist) / close if close else float('inf')
+            return (0, score) if hist < 0 else (2, score)
+
+        return sorted(symbols, key=key)
+
+    def report(self, done, total):
+        """Итог прохода; предупреждает, если проход не уложился в дедлайн."""
+        elapsed = self.clock() - self.started
+        finished = datetime.now().strftime('%H:%M:%S')
+        if done < total or self.expired():
+            print(f"ВНИМАНИЕ: проход не уложился в дедлайн - проверено {done} из {total} "
+                  f"токенов за {elapsed:.1f} сек ({finished}).")
+        else:
+            print(f"Проверка всех токенов завершена за {elapsed:.1f} сек ({finished}).")
@@ -0,0 +1,358 @@
+"""
+Шардированный режим: несколько процессов (на этой машине или на других)
+делят между собой список токенов.
+
+Координатор держит список токенов (UniverseManager) и расписание
+проходов, на каждый проход раздает воркерам их части. Воркер - отдельный
+процесс со своими буферами свечей и своей долей лимита запросов -
+загружает свечи и проверяет сигналы (main.scan_symbols) только по своей
+части. События сигналов воркер отправляет координатору, тот убирает
+повторы и выводит их как обычно (events.py).
+
+Раздача - rendezvous-хешированием: символ достается воркеру с наибольшим
+хешем (воркер, символ). Когда воркер пропадает (процесс умер или нет
+heartbeat дольше SHARD_WORKER_TIMEOUT), переезжают только его символы -
+сразу, в том же проходе; остальные остаются там, где у них уже есть
+буферы. Локальные воркеры при этом перезапускаются.
+
+Связь - очереди multiprocessing.managers по TCP: локальные воркеры
+запускаются координатором, воркеры на других машинах подключаются сами
+(у каждой машины свой IP - и свой лимит запросов Bybit):
+
+    python shard.py                                         # координатор + SHARD_WORKERS локальных воркеров
+    python shard.py worker --connect 10.0.0.1:50000 --name node2
+"""
+import argparse
+import hashlib
+import itertools
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+
+import config
+import events
+import main
+import metrics
+from fetcher import RateLimiter
+from scheduler import CandleScheduler
+
+
+def score(worker, symbol):
+    """Стабильный между процессами и запусками хеш пары (воркер, символ)."""
+    digest = hashlib.blake2b(f"{worker}\0{symbol}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def assign(symbols, workers):
+    """Раздача символов воркерам: {воркер: [символы в исходном порядке]}."""
+    shards = {w: [] for w in workers}
+    if not shards:
+        return shards
+    for symbol in symbols:
+        shards[max(workers, key=lambda w: score(w, symbol))].append(symbol)
+    return shards
+
+
+class QueueOutput:
+    """Выход events.py для воркера: пачки событий - в очередь координатора."""
+
+    def __init__(self, results, name):
+        self.results = results
+        self.name = name
+
+    def write(self, records, lines):
+        self.results.put(('events', self.name, records))
+
+
+class Aggregator:
+    """
+    Сводит события всех воркеров в общий events.emit(). Событие одного
+    типа по той же свече символа (после переезда символа его может
+    проверить и новый воркер, с чуть другими значениями MACD) выводится
+    один раз; помнит последние max_keys событий.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self.seen = OrderedDict()
+        self.duplicates = 0
+
+    def publish(self, worker, records):
+        for record in records:
+            fields = {k: v for k, v in record.items() if k not in ('event', 'ts')}
+            key = (record['event'], record.get('symbol'), record.get('timeframe'), record.get('time'))
+            if key in self.seen:
+                self.duplicates += 1
+                metrics.inc('shard_duplicates_total')
+                continue
+            self.seen[key] = True
+            if len(self.seen) > self.max_keys:
+                self.seen.popitem(last=False)
+            events.emit(record['event'], ts=record.get('ts'), worker=worker, **fields)
+
+
+class _Client(BaseManager):
+    pass
+
+
+_Client.register('tasks')
+_Client.register('results')
+
+
+def parse_address(text):
+    host, port = text.rsplit(':', 1)
+    return host, int(port)
+
+
+def run_worker(name, address, authkey, rate=None):
+    """
+    Процесс-воркер: подключается к координатору и выполняет проходы по
+    присланным частям списка, пока координатор не пришлет stop или не
+    пропадет.
+    """
+    manager = _Client(address=tuple(address), authkey=authkey)
+    manager.connect()
+    tasks, results = manager.tasks(name), manager.results()
+    if rate:
+        main.limiter = RateLimiter(rate, rate)
+    events.configure([QueueOutput(results, name)], batch_size=config.EVENTS_BATCH_SIZE,
+                     flush_interval=config.EVENTS_FLUSH_SEC)
+    scheduler = CandleScheduler('5')
+    last_hist = {}
+    confluence = main.make_confluence()
+    running = True
+
+    def heartbeat():
+        while running:
+            try:
+                results.put(('heartbeat', name))
+            except (OSError, EOFError):
+                return
+            time.sleep(config.SHARD_HEARTBEAT_SEC)
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    results.put(('hello', name))
+    try:
+        while True:
+            task = tasks.get()
+            if task[0] == 'stop':
+                break
+            # deadline - по часам координатора, часы машин должны быть синхронизированы (NTP)
+            _, task_id, primary, low, deadline = task
+            total = len(primary) + len(low)
+            if time.time() > deadline:
+                # Задача устарела, пока воркер был занят или перезапускался
+                results.put(('done', name, task_id, 0, total))
+                continue
+            scheduler.started, scheduler.deadline = time.time(), deadline
+            symbols = scheduler.prioritize(primary, last_hist) + low
+            skipped = main.scan_symbols(symbols, scheduler, last_hist, confluence)
+            results.put(('done', name, task_id, total - skipped, total))
+    except (OSError, EOFError):
+        print(f"Воркер {name}: координатор недоступен, выхожу.")
+    finally:
+        running = False
+        events.configure([])
+
+
+class Coordinator:
+    """
+    Раздает части списка токенов воркерам и собирает их события.
+    local_workers - сколько воркеров запустить на этой машине; каждый
+    получает worker_rate запросов в секунду (по умолчанию - поровну от
+    RATE_LIMIT_PER_SEC, ведь IP у них общий).
+    """
+
+    def __init__(self, universe, local_workers=4, address=('127.0.0.1', 50000), authkey=b'',
+                 worker_rate=None, timeout=30.0, clock=time.time):
+        self.universe = universe
+        self.local_workers = local_workers
+        self.address = address
+        self.authkey = authkey
+        self.worker_rate = worker_rate
+        self.timeout = timeout
+        self.clock = clock
+        self.aggregator = Aggregator()
+        self.queues = {}
+        self.results = queue.Queue()
+        self.seen = {}          # воркер -> время последнего сообщения
+        self.processes = {}     # локальные воркеры: имя -> процесс
+        self.outstanding = {}   # воркер -> [задачи текущего прохода без ответа]
+        self.ids = itertools.count()
+        self.done = 0
+        self.lock = threading.Lock()
+
+    def _tasks(self, name):
+        with self.lock:
+            return self.queues.setdefault(name, queue.Queue())
+
+    def _results(self):
+        return self.results
+
+    def start(self):
+        class Server(BaseManager):
+            pass
+
+        Server.register('tasks', callable=self._tasks)
+        Server.register('results', callable=self._results)
+        server = Server(address=self.address, authkey=self.authkey).get_server()
+        self.address = server.address
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        for i in range(self.local_workers):
+            self._spawn(f"local-{i}")
+        return self
+
+    def _spawn(self, name):
+        context = multiprocessing.get_context('spawn')
+        process = context.Process(target=run_worker, args=(name, self.address, self.authkey, self.worker_rate),
+                                  name=f"shard-{name}", daemon=True)
+        process.start()
+        self.processes[name] = process
+
+    def _respawn(self):
+        for name, process in list(self.processes.items()):
+            if not process.is_alive():
+                print(f"Воркер {name} завершился (код {process.exitcode}) - перезапускаю.")
+                metrics.inc('shard_restarts_total')
+                self._spawn(name)
+
+    def alive(self):
+        now = self.clock()
+        return sorted(name for name, seen in self.seen.items()
+                      if now - seen <= self.timeout
+                      and (name not in self.processes or self.processes[name].is_alive()))
+
+    def dispatch(self, primary, low, deadline, workers):
+        """Делит символы между workers и отправляет им задачи."""
+        primary_shards, low_shards = assign(primary, workers), assign(low, workers)
+        for name in workers:
+            if not primary_shards[name] and not low_shards[name]:
+                continue
+            task = (next(self.ids), primary_shards[name], low_shards[name], deadline)
+            self.outstanding.setdefault(name, []).append(task)
+            self._tasks(name).put(('scan',) + task)
+
+    def _handle(self, message):
+        kind, name = message[0], message[1]
+        self.seen[name] = self.clock()
+        if kind == 'hello':
+            print(f"Воркер {name} подключился.")
+        elif kind == 'events':
+            self.aggregator.publish(name, message[2])
+        elif kind == 'done':
+            _, _, task_id, done, total = message
+            tasks = self.outstanding.get(name, [])
+            for task in tasks:
+                if task[0] == task_id:
+                    tasks.remove(task)
+                    self.done += done
+                    break
+
+    def _reassign(self):
+        """Задачи пропавших воркеров - оставшимся."""
+        alive = self.alive()
+        for name in [n for n, tasks in self.outstanding.items() if tasks and n not in alive]:
+            tasks = self.outstanding.pop(name)
+            # Необработанные задачи пропавшего воркера больше не нужны
+            pending = self._tasks(name)
+            while not pending.empty():
+                pending.get_nowait()
+            if not alive:
+                continue
+            print(f"Воркер {name} не отвечает - его символы переданы: {', '.join(alive)}.")
+            metrics.inc('shard_reassigned_total')
+            for _, primary, low, deadline in tasks:
+                self.dispatch(primary, low, deadline, alive)
+
+    def pump(self, until):
+        """Обрабатывает сообщения воркеров до момента until."""
+        while True:
+            timeout = until - self.clock()
+            if timeout <= 0:
+                return
+            try:
+                self._handle(self.results.get(timeout=min(timeout, 1.0)))
+            except queue.Empty:
+                pass
+            self._reassign()
+
+    def wait_for_workers(self, count, timeout):
+        deadline = self.clock() + timeout
+        while len(self.alive()) < count and self.clock() < deadline:
+            self.pump(min(deadline, self.clock() + 0.5))
+        return self.alive()
+
+    def run(self, scheduler):
+        for close, deadline in scheduler.cycles():
+            self._respawn()
+            workers = self.alive()
+            if not workers:
+                print("Нет подключенных воркеров - пропускаю проход.")
+                continue
+            primary, low = self.universe.groups()
+            total = len(primary) + len(low)
+            self.done = 0
+            self.outstanding.clear()
+            self.dispatch(primary, low, deadline, workers)
+            while any(self.outstanding.values()) and self.clock() < deadline:
+                self.pump(min(deadline, self.clock() + 1.0))
+            metrics.observe('cycle_seconds', self.clock() - scheduler.started)
+            scheduler.report(self.done, total)
+
+    def stop(self):
+        for name in list(self.queues):
+            self._tasks(name).put(('stop',))
+        for process in self.processes.values():
+            process.join(5)
+
+
+def main_coordinator(args):
+    print("Запуск координатора...")
+    universe = main.start_services()
+
+    rate = args.rate or (config.RATE_LIMIT_PER_SEC / args.workers if args.workers else None)
+    coordinator = Coordinator(universe, args.workers, parse_address(args.listen), config.SHARD_AUTHKEY,
+                              worker_rate=rate, timeout=config.SHARD_WORKER_TIMEOUT)
+    coordinator.start()
+    print(f"Координатор слушает {coordinator.address[0]}:{coordinator.address[1]}, "
+          f"локальных воркеров: {args.workers}.")
+    coordinator.wait_for_workers(args.workers, config.SHARD_WORKER_TIMEOUT)
+    scheduler = CandleScheduler('5', settle=config.SCHEDULE_SETTLE_SEC, deadline=config.SCAN_DEADLINE_SEC,
+                                clock=coordinator.clock,
+                                sleep=lambda seconds: coordinator.pump(coordinator.clock() + seconds))
+    try:
+        coordinator.run(scheduler)
+    finally:
+        coordinator.stop()
+
+
+def main_worker(args):
+    print(f"Воркер {args.name} подключается к {args.connect}...")
+    run_worker(args.name, parse_address(args.connect), config.SHARD_AUTHKEY, args.rate or config.RATE_LIMIT_PER_SEC)
+
+
+def main_shard(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('role', nargs='?', choices=('coordinator', 'worker'), default='coordinator')
+    parser.add_argument('--workers', type=int, default=config.SHARD_WORKERS,
+                        help='локальных воркеров у координатора')
+    parser.add_argument('--listen', default=config.SHARD_LISTEN, help='адрес координатора host:port')
+    parser.add_argument('--connect', default=config.SHARD_LISTEN, help='адрес координатора для воркера')
+    parser.add_argument('--name', default=None, help='имя воркера (уникальное)')
+    parser.add_argument('--rate', type=float, default=None, help='лимит запросов воркера, запросов/сек')
+    args = parser.parse_args(argv)
+    if args.role == 'worker':
+        if not args.name:
+            parser.error('для воркера нужно --name')
+        main_worker(args)
+    else:
+        main_coordinator(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_shard())
@@ -0,0 +1,214 @@
+"""
+Старшие таймфреймы из 5-минутных свечей.
+
+Вместо отдельного get_kline на каждый таймфрейм свечи 15m/1h/4h
+собираются локально из уже загруженных 5-минутных: open - первой свечи
+корзины, high - максимум, low - минимум, close - последней, volume и
+turnover - суммы. Границы корзин - как у биржи: начало свечи кратно
+длительности интервала от 1970-01-01 UTC (так Bybit выравнивает все
+минутные интервалы до 720 включительно).
+
+Свеча старшего таймфрейма считается закрытой, когда закрылась последняя
+5-минутка ее корзины. Корзина с пропущенной 5-минуткой не собирается -
+получается разрыв, и буфер таймфрейма начинается заново, как при
+разрыве в истории базового буфера.
+
+Историю для прогрева MACD дает CandleStore с 5-минутками (для 4h нужно
+~50 суток); без хранилища старший таймфрейм накапливается по ходу работы.
+"""
+import numpy as np
+
+from candle_buffer import COLUMNS, CandleBuffer
+
+
+def interval_ms(interval):
+    return int(interval) * 60 * 1000
+
+
+def bucket_start(ts, tf_ms):
+    """Начало свечи таймфрейма tf_ms, в которую попадает момент ts (мс)."""
+    return ts - ts % tf_ms
+
+
+def aggregate(candles):
+    """Свечи по возрастанию времени (кортежи в порядке COLUMNS) -> одна свеча."""
+    first, last = candles[0], candles[-1]
+    return (first[0], first[1],
+            max(c[2] for c in candles), min(c[3] for c in candles), last[4],
+            sum(c[5] for c in candles), sum(c[6] for c in candles))
+
+
+def resample(columns, tf_ms, base_ms):
+    """
+    Колонки базовых свечей (см. CandleStore.read) -> колонки полных свечей
+    таймфрейма tf_ms и хвост базовых свечей последней незавершенной корзины.
+    """
+    ts = np.asarray(columns['timestamp'])
+    if not len(ts):
+        return {c: np.asarray(columns[c][:0]) for c in COLUMNS}, []
+    buckets = bucket_start(ts, tf_ms)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(ts)]
+    complete = ends - starts == tf_ms // base_ms
+    out = {
+        'timestamp': buckets[starts],
+        'open': np.asarray(columns['open'])[starts],
+        'high': np.maximum.reduceat(np.asarray(columns['high']), starts),
+        'low': np.minimum.reduceat(np.asarray(columns['low']), starts),
+        'close': np.asarray(columns['close'])[ends - 1],
+        'volume': np.add.reduceat(np.asarray(columns['volume']), starts),
+        'turnover': np.add.reduceat(np.asarray(columns['turnover']), starts),
+    }
+    out = {c: v[complete] for c, v in out.items()}
+    tail = []
+    if not complete[-1]:
+        tail = list(zip(*(np.asarray(columns[c])[starts[-1]:].tolist() for c in COLUMNS)))
+    return out, tail
+
+
+class TimeframeBuffer:
+    """
+    CandleBuffer старшего таймфрейма, который пополняется закрытыми
+    5-минутками базового буфера. partial - закрытые базовые свечи текущей
+    (еще не закрытой) корзины.
+    """
+
+    def __init__(self, symbol, interval, base='5', size=200):
+        self.symbol = symbol
+        self.interval = str(interval)
+        self.interval_ms = interval_ms(interval)
+        self.base_ms = interval_ms(base)
+        if self.interval_ms <= self.base_ms or self.interval_ms % self.base_ms:
+            raise ValueError(f"Таймфрейм {interval} не собрать из свечей {base}")
+        self.per_bucket = self.interval_ms // self.base_ms
+        self.buffer = CandleBuffer(symbol, interval, size)
+        self.reset()
+
+    def reset(self):
+        self.buffer.reset()
+        self.partial = []
+        self.last_base_ts = None
+        self.base_forming = None
+
+    @property
+    def last_ts(self):
+        """Начало последней закрытой свечи таймфрейма."""
+        return self.buffer.last_ts
+
+    def history_limit(self):
+        """Сколько базовых свечей нужно прочитать, чтобы заполнить буфер целиком."""
+        return (self.buffer.size + 1) * self.per_bucket
+
+    def load(self, columns):
+        """Начальное заполнение из сохраненной истории базовых свечей."""
+        bars, tail = resample(columns, self.interval_ms, self.base_ms)
+        self.buffer.load(bars, min_bars=1)
+        if not len(columns['timestamp']):
+            return
+        self.last_base_ts = int(columns['timestamp'][-1])
+        if tail and self.buffer.last_ts is not None \
+                and bucket_start(tail[0][0], self.interval_ms) == self.buffer.last_ts + self.interval_ms:
+            self.partial = tail
+
+    def _commit(self, candle):
+        if self.buffer.last_ts is not None and self.buffer.push(candle, confirmed=True):
+            return
+        # Первая свеча или разрыв - начинаем буфер заново с этой свечи
+        self.buffer.reset()
+        close = candle[4]
+        placeholder = (candle[0] + self.interval_ms, close, close, close, close, 0.0, 0.0)
+        self.buffer.update([candle, placeholder])
+
+    def add_closed(self, candle):
+        """Закрытая базовая свеча. Возвращает True, если закрылась свеча таймфрейма."""
+        bucket = bucket_start(candle[0], self.interval_ms)
+        if self.partial and bucket_start(self.partial[0][0], self.interval_ms) != bucket:
+            self.partial = []  # корзина не добралась до конца - в базе был пропуск
+        self.partial.append(candle)
+        self.last_base_ts = candle[0]
+        if candle[0] + self.base_ms != bucket + self.interval_ms:
+            return False
+        complete = len(self.partial) == self.per_bucket
+        if complete:
+            self._commit(aggregate(self.partial))
+        self.partial = []
+        return complete
+
+    def sync(self, base):
+        """Дописывает новые закрытые свечи базового буфера base (CandleBuffer)."""
+        fresh = []
+        for candle in reversed(base.closed):
+            if self.last_base_ts is not None and candle[0] <= self.last_base_ts:
+                break
+            fresh.append(candle[:7])
+        closed = 0
+        for candle in reversed(fresh):
+            closed += self.add_closed(candle)
+        self.base_forming = base.forming[:7] if base.forming is not None else None
+        return closed
+
+    def forming(self):
+        """Текущая свеча таймфрейма: закрытые базовые свечи корзины плюс незакрытая."""
+        if self.buffer.last_ts is None:
+            return None
+        bucket = self.buffer.last_ts + self.interval_ms
+        parts = [c for c in self.partial if bucket_start(c[0], self.interval_ms) == bucket]
+        if self.base_forming is not None and bucket_start(self.base_forming[0], self.interval_ms) == bucket:
+            parts.append(self.base_forming)
+        return aggregate(parts) if parts else None
+
+    def view(self):
+        """CandleBuffer таймфрейма с текущей свечой - строки кадра без DataFrame."""
+        candle = self.forming()
+        if candle is not None:
+            self.buffer.push(candle, confirmed=False)
+        return self.buffer
+
+    def to_frame(self):
+        """DataFrame таймфрейма в том же виде, что get_historical_data(symbol, interval)."""
+        return self.view().to_frame()
+
+
+class MultiTimeframe:
+    """Набор TimeframeBuffer одного символа поверх общего базового буфера."""
+
+    def __init__(self, symbol, intervals, base='5', size=200):
+        self.symbol = symbol
+        self.base = str(base)
+        self.buffers = {str(tf): TimeframeBuffer(symbol, tf, base, size) for tf in intervals}
+
+    def load(self, store):
+        for tf_buffer in self.buffers.values():
+            tf_buffer.load(store.read(self.symbol, self.base, tf_buffer.history_limit()))
+
+    def sync(self, base):
+        for tf_buffer in self.buffers.values():
+            tf_buffer.sync(base)
+
+    def frames(self):
+        return {tf: tf_buffer.to_frame() for tf, tf_buffer in self.buffers.items()}
+
+
+class Confluence:
+    """
+    Совпадение точек входа на всех таймфреймах: add() запоминает время
+    закрытия свечи сигнала и возвращает True, когда у символа есть вход
+    на каждом таймфрейме и все они не дальше window секунд друг от друга.
+    """
+
+    def __init__(self, timeframes, window):
+        self.timeframes = set(map(str, timeframes))
+        self.window = window
+        self.entries = {}
+
+    def add(self, symbol, timeframe, close_ts):
+        entries = self.entries.setdefault(symbol, {})
+        entries[str(timeframe)] = close_ts
+        # Слишком старые входы больше не могут совпасть с новыми
+        for tf, ts in list(entries.items()):
+            if close_ts - ts > self.window:
+                del entries[tf]
+        if set(entries) != self.timeframes:
+            return False
+        del self.entries[symbol]
+        return True
@@ -0,0 +1,138 @@
+"""
+Автообновляемый список торгуемых символов.
+
+Вместо списка, вставленного руками из test.py, UniverseManager в фоне
+перечитывает instruments-info (какие пары торгуются) и одним запросом
+берет снимок /v5/market/tickers?category=spot по всем парам. Пары с
+оборотом за 24 часа ниже порога или слишком широким спредом исключаются
+(или уходят в конец очереди), а новый список подменяется на ходу.
+"""
+import threading
+import time
+
+from fetcher import request_with_retry
+
+
+def fetch_instruments(session, limiter=None, category="spot"):
+    """Все инструменты категории (с переходом по страницам nextPageCursor)."""
+    items, cursor = [], None
+    while True:
+        params = {"category": category}
+        if cursor:
+            params["cursor"] = cursor
+        response = request_with_retry(lambda: session.get_instruments_info(**params), limiter=limiter)
+        result = response.get("result", {})
+        items.extend(result.get("list", []) or [])
+        cursor = result.get("nextPageCursor")
+        if not cursor:
+            return items
+
+
+def fetch_tickers(session, limiter=None, category="spot"):
+    """Снимок тикеров по всем парам категории одним запросом: {symbol: тикер}."""
+    response = request_with_retry(lambda: session.get_tickers(category=category), limiter=limiter)
+    return {t["symbol"]: t for t in response.get("result", {}).get("list", []) or []}
+
+
+def spread_percent(ticker):
+    try:
+        bid, ask = float(ticker.get("bid1Price") or 0), float(ticker.get("ask1Price") or 0)
+    except ValueError:
+        return None
+    if bid <= 0 or ask <= 0:
+        return None
+    return (ask - bid) / ((ask + bid) / 2) * 100
+
+
+def select_symbols(instruments, tickers, quote="USDT", min_turnover=0.0, max_spread=None):
+    """
+    Делит торгуемые пары с котировкой quote на ликвидные и неликвидные.
+    Возвращает (liquid, illiquid) - списки символов, ликвидные по убыванию оборота.
+    """
+    liquid, illiquid = [], []
+    for it in instruments:
+        symbol = it.get("symbol")
+        if it.get("status") != "Trading" or (quote and it.get("quoteCoin") != quote):
+            continue
+        ticker = tickers.get(symbol)
+        if ticker is None:
+            illiquid.append((0.0, symbol))
+            continue
+        turnover = float(ticker.get("turnover24h") or 0)
+        spread = spread_percent(ticker)
+        ok = turnover >= min_turnover and (max_spread is None or (spread is not None and spread <= max_spread))
+        (liquid if ok else illiquid).append((turnover, symbol))
+    liquid.sort(key=lambda x: (-x[0], x[1]))
+    illiquid.sort(key=lambda x: (-x[0], x[1]))
+    return [s for _, s in liquid], [s for _, s in illiquid]
+
+
+class UniverseManager:
+    """
+    Держит актуальный список символов. symbols()/groups() можно звать из
+    любого потока - состояние подменяется целиком, без блокировок у читателей.
+
+    illiquid='drop' - неликвидные пары не проверяются вовсе,
+    illiquid='last' - проверяются после всех ликвидных.
+    """
+
+    def __init__(self, session, limiter=None, fallback=(), quote="USDT", min_turnover=0.0,
+                 max_spread=None, illiquid='drop', refresh_sec=900):
+        self.session = session
+        self.limiter = limiter
+        self.quote = quote
+        self.min_turnover = min_turnover
+        self.max_spread = max_spread
+        self.illiquid = illiquid
+        self.refresh_sec = refresh_sec
+        # (основные, в конец очереди) - подменяется одним присваиванием
+        self.state = (tuple(fallback), ())
+        self.updated = None
+        self.running = False
+
+    def groups(self):
+        """(основные символы, символы в конец очереди)."""
+        primary, low = self.state
+        return list(primary), list(low)
+
+    def symbols(self):
+        primary, low = self.state
+        return list(primary) + list(low)
+
+    def refresh(self):
+        """Перечитывает инструменты и тикеры. При ошибке оставляет прежний список."""
+        try:
+            instruments = fetch_instruments(self.session, self.limiter)
+            tickers = fetch_tickers(self.session, self.limiter)
+        except Exception as e:
+            print(f"Не удалось обновить список токенов: {e}")
+            return False
+        liquid, illiquid = select_symbols(instruments, tickers, self.quote, self.min_turnover, self.max_spread)
+        state = (tuple(liquid), tuple(illiquid) if self.illiquid == 'last' else ())
+        if not state[0]:
+            print("Список токенов после фильтра пуст - оставляю прежний.")
+            return False
+        before = set(self.symbols())
+        self.state = state
+        self.updated = time.time()
+        after = set(self.symbols())
+        if before != after:
+            print(f"Список токенов обновлен: {len(after)} токенов "
+                  f"(+{len(after - before)} / -{len(before - after)}, неликвидных: {len(illiquid)}).")
+        return True
+
+    def start(self):
+        """Первое обновление сразу, дальше - в фоне раз в refresh_sec секунд."""
+        self.refresh()
+        self.running = True
+
+        def loop():
+            while self.running:
+                time.sleep(self.refresh_sec)
+                self.refresh()
+
+        threading.Thread(target=loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,200 @@
+"""
+Условия check_entry_signal() операциями над массивами.
+
+Гистограмма MACD и минимумы складываются в матрицы (n_строк, n_свечей),
+выровненные по правому краю (последняя свеча - в последнем столбце,
+недостающая история слева заполнена NaN), и правило проверяется сразу
+для всех строк.
+
+В живом проходе (main.scan_symbols) это предварительный фильтр: по всем
+символам одним вызовом ищется пересечение нуля, а DataFrame и
+check_entry_signal() с событиями - только для нашедшихся. Матрицы
+собираются прямо из массивов CandleBuffer (MACD уже посчитан потоково),
+а на полном пути MACD всех символов считает batch_macd() одним проходом
+по матрице цен (batch_frames). Строки матриц не обязаны быть символами:
+backtest.py подает сюда хвосты кадров всех пересечений нуля за историю.
+"""
+import numpy as np
+import pandas as pd
+
+from candle_buffer import COLUMNS
+
+MIN_BARS = 61       # как в check_entry_signal
+RECENT = 10         # окно поиска свечи 1 (iloc[-12:-2])
+LOOKBACK = 50       # окно поиска свечи 2 перед свечой 1
+GUARD = 50          # минимальный номер свечи 1 в кадре (candle1_loc < 50)
+MIN_PRICE_DIFF = 3.0
+
+
+class FrameArrays:
+    """
+    Строки кадра get_historical_data() колонками numpy ('timestamp' - мс
+    UTC). Интерфейс как у CandleBuffer: len(), arrays(), to_frame().
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['timestamp'])
+
+    def arrays(self, columns):
+        return {c: self.columns[c] for c in columns}
+
+    def to_frame(self):
+        index = pd.to_datetime(self.columns['timestamp'].astype(np.int64), unit='ms', utc=True)
+        df = pd.DataFrame({c: v for c, v in self.columns.items() if c != 'timestamp'}, index=index)
+        df.index.name = 'timestamp'
+        df.index = df.index.tz_convert('Asia/Yekaterinburg')
+        return df
+
+
+def stack_frames(frames, columns=('close', 'low', 'MACDh_12_26_9')):
+    """
+    {symbol: DataFrame, CandleBuffer или FrameArrays} -> (symbols, {column: матрица}, lengths).
+    У буферов колонки берутся через arrays(), без DataFrame. Пустые и None пропускаются.
+    """
+    frames = {s: f for s, f in frames.items() if f is not None and len(f)}
+    symbols = list(frames)
+    lengths = np.array([len(frames[s]) for s in symbols], dtype=np.int64)
+    n_bars = int(lengths.max()) if len(symbols) else 0
+    arrays = {column: np.full((len(symbols), n_bars), np.nan) for column in columns}
+    for i, symbol in enumerate(symbols):
+        frame = frames[symbol]
+        if isinstance(frame, pd.DataFrame):
+            values = {c: frame[c].to_numpy(dtype=np.float64) for c in columns}
+        else:
+            values = frame.arrays(columns)
+        for column in columns:
+            arrays[column][i, n_bars - lengths[i]:] = values[column]
+    return symbols, arrays, lengths
+
+
+def batch_ema(values, length):
+    """
+    EMA по строкам матрицы, как pandas_ta.ema: SMA первых `length`
+    значений строки, дальше ewm(adjust=False). Ведущие NaN пропускаются.
+    """
+    n_rows, n_bars = values.shape
+    alpha = 2 / (length + 1)
+    out = np.full(values.shape, np.nan)
+    count = np.zeros(n_rows, dtype=np.int64)
+    total = np.zeros(n_rows)
+    ema = np.full(n_rows, np.nan)
+    for t in range(n_bars):
+        x = values[:, t]
+        valid = ~np.isnan(x)
+        count += valid
+        total += np.where(valid, x, 0.0)
+        ema = np.where(valid & (count == length), total / length, ema)
+        ema = np.where(valid & (count > length), ema + alpha * (x - ema), ema)
+        out[:, t] = np.where(valid & (count >= length), ema, np.nan)
+    return out
+
+
+def batch_macd(close, fast=12, slow=26, signal=9):
+    """MACD, гистограмма и сигнальная линия для всех строк сразу."""
+    macd = batch_ema(close, fast) - batch_ema(close, slow)
+    signal_line = batch_ema(macd, signal)
+    return macd, macd - signal_line, signal_line
+
+
+def batch_frames(candles, fast=12, slow=26, signal=9):
+    """
+    {symbol: свечи (n, 7) в порядке COLUMNS по возрастанию времени} ->
+    {symbol: FrameArrays}. MACD всех символов - одним batch_macd по матрице
+    цен; строки без гистограммы отбрасываются, как dropna() в
+    get_historical_data.
+    """
+    candles = {s: c for s, c in candles.items() if c is not None and len(c)}
+    symbols = list(candles)
+    lengths = np.array([len(candles[s]) for s in symbols], dtype=np.int64)
+    n_bars = int(lengths.max()) if len(symbols) else 0
+    close = np.full((len(symbols), n_bars), np.nan)
+    for i, symbol in enumerate(symbols):
+        close[i, n_bars - lengths[i]:] = candles[symbol][:, COLUMNS.index('close')]
+    suffix = f'{fast}_{slow}_{signal}'
+    macd = dict(zip((f'MACD_{suffix}', f'MACDh_{suffix}', f'MACDs_{suffix}'), batch_macd(close, fast, slow, signal)))
+    result = {}
+    for i, symbol in enumerate(symbols):
+        rows = candles[symbol]
+        tail = {name: values[i, n_bars - lengths[i]:] for name, values in macd.items()}
+        keep = ~np.isnan(tail[f'MACDs_{suffix}'])
+        columns = {c: rows[keep, j] for j, c in enumerate(COLUMNS)}
+        columns.update({name: values[keep] for name, values in tail.items()})
+        result[symbol] = FrameArrays(columns)
+    return result
+
+
+def find_signals(symbols, low, hist, lengths, close=None, recent=RECENT, lookback=LOOKBACK,
+                 guard=GUARD, min_price_diff=MIN_PRICE_DIFF, min_bars=MIN_BARS):
+    """
+    Условия check_entry_signal() для всех символов сразу (параметры правила -
+    как у check_entry_signal, min_bars = guard + recent + 1).
+
+    Возвращает список словарей по символам, у которых гистограмма пересекла
+    ноль снизу вверх на последней закрытой свече. stage показывает, где
+    остановилась проверка: 'no_recent' / 'too_early' / 'no_prev' /
+    'candidate'; entry=True - найдена точка входа.
+    """
+    # Для пересечения нужны две закрытые свечи и незакрытая
+    if not len(symbols) or hist.shape[1] < 3:
+        return []
+    n_bars = hist.shape[1]
+    offset = n_bars - lengths
+
+    crossed = (lengths >= min_bars) & (hist[:, -3] < 0) & (hist[:, -2] > 0)
+    rows = np.flatnonzero(crossed)
+    if not len(rows):
+        return []
+    hist, low = hist[rows], low[rows]
+
+    # Свеча 1: минимум отрицательной гистограммы среди 10 последних закрытых
+    last = hist[:, -recent - 2:-2]
+    has_recent = (last < 0).any(axis=1)
+    loc1 = n_bars - recent - 2 + np.argmin(np.where(last < 0, last, np.inf), axis=1)
+    in_range = loc1 - offset[rows] >= guard
+
+    # Свеча 2: минимум отрицательной гистограммы в 50 свечах перед свечой 1
+    # (не раньше начала кадра - как iloc[max(0, loc - 50):loc])
+    start = np.maximum(offset[rows], 0)[:, None]
+    window = np.clip(loc1[:, None] + np.arange(-lookback, 0), start, n_bars - 1)
+    prev = np.take_along_axis(hist, window, axis=1)
+    has_prev = (prev < 0).any(axis=1)
+    loc2 = np.take_along_axis(window, np.argmin(np.where(prev < 0, prev, np.inf), axis=1)[:, None], axis=1)[:, 0]
+
+    pick = np.arange(len(rows))
+    macd1, low1 = hist[pick, loc1], low[pick, loc1]
+    macd2, low2 = hist[pick, loc2], low[pick, loc2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price_diff = (low2 - low1) / low2 * 100
+    entry = has_recent & in_range & has_prev & (macd1 > macd2) & (low1 < low2) & (price_diff > min_price_diff)
+
+    results = []
+    for k, row in enumerate(rows):
+        if not has_recent[k]:
+            stage = 'no_recent'
+        elif not in_range[k]:
+            stage = 'too_early'
+        elif not has_prev[k]:
+            stage = 'no_prev'
+        else:
+            stage = 'candidate'
+        result = {'symbol': symbols[row], 'stage': stage, 'entry': bool(entry[k])}
+        if stage == 'candidate':
+            result.update({
+                'loc1': int(loc1[k] - offset[row]), 'macd1': float(macd1[k]), 'low1': float(low1[k]),
+                'loc2': int(loc2[k] - offset[row]), 'macd2': float(macd2[k]), 'low2': float(low2[k]),
+                'price_diff': float(price_diff[k]),
+            })
+            if close is not None:
+                result['close'] = float(close[row, -2])
+        results.append(result)
+    return results
+
+
+def scan_frames(frames):
+    """Проверка по кадрам get_historical_data, буферам CandleBuffer или FrameArrays."""
+    symbols, arrays, lengths = stack_frames(frames)
+    return find_signals(symbols, arrays['low'], arrays['MACDh_12_26_9'], lengths, arrays['close'])
+
@@ -0,0 +1,234 @@
+"""
+Режим работы от WebSocket: вместо опроса всех символов по REST бот
+подписывается на kline.<interval>.<symbol> и проверяет сигнал сразу,
+как только приходит закрытая свеча (confirm=true).
+
+REST используется только для начальной загрузки истории и для догрузки
+пропусков после переподключения. Старшие таймфреймы (TIMEFRAMES) и
+MTF_MODE='confluence' работают так же, как в опросе: свечи таймфреймов
+собираются из закрытых 5-минуток потока. Запуск: python ws_stream.py
+"""
+import queue
+import threading
+import time
+import zlib
+
+from pybit.unified_trading import WebSocket
+
+import config
+import metrics
+from candle_buffer import CandleBuffer
+from candle_store import CandleStore
+from fetcher import fetch_all
+from main import (fetch_klines, check_entry_signal, start_services, get_timeframe_buffers,
+                  make_confluence, confirm_entry)
+from timeframes import MultiTimeframe
+
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class KlineStream:
+    """
+    Набор WebSocket-соединений на все символы и буферы свечей по ним.
+
+    ws_factory - функция без аргументов, возвращающая подключенный клиент
+    с интерфейсом pybit WebSocket (kline_stream, exit); fetch_fn и clock
+    подменяются для работы с локальной имитацией биржи (см. fake_ws.py).
+    on_signal(df, symbol, timeframe=None) возвращает True, если найден вход.
+    """
+
+    def __init__(self, symbols, interval='5', ws_factory=None, fetch_fn=None,
+                 clock=None, on_signal=check_entry_signal, store=None):
+        self.symbols = list(symbols)
+        self.interval = str(interval)
+        self.interval_ms = int(interval) * 60 * 1000
+        self.ws_factory = ws_factory or (lambda: WebSocket(testnet=False, channel_type="spot"))
+        self.fetch_fn = fetch_fn or fetch_klines
+        self.clock = clock or time.time
+        self.on_signal = on_signal
+        self.store = store
+        self.buffers = {s: CandleBuffer(s, interval, config.CANDLE_HISTORY) for s in self.symbols}
+        # Старшие таймфреймы - из закрытых свечей тех же буферов
+        self.timeframes = {s: MultiTimeframe(s, config.TIMEFRAMES, self.interval, config.MTF_HISTORY)
+                           for s in self.symbols} if config.TIMEFRAMES else {}
+        if store is not None:
+            for symbol, buffer in self.buffers.items():
+                buffer.load(store.read(symbol, self.interval, buffer.size))
+            for mtf in self.timeframes.values():
+                mtf.load(store)
+        self.confluence = make_confluence(buffered=True)
+        self.evaluated = {}
+        self.connections = []
+        self.gaps_checked_for = None
+        self.queues = [queue.Queue() for _ in range(config.WS_WORKERS)]
+        self.running = False
+
+    # --- Соединения ---
+
+    def _open(self, conn):
+        conn['ws'] = self.ws_factory()
+        conn['last_msg'] = time.monotonic()
+        # Bybit spot не принимает больше 10 топиков в одном запросе subscribe
+        for batch in chunks(conn['symbols'], config.WS_TOPICS_PER_REQUEST):
+            conn['ws'].kline_stream(
+                interval=int(self.interval),
+                symbol=batch,
+                callback=lambda message, conn=conn: self._on_message(conn, message),
+            )
+
+    def _reconnect(self, conn):
+        print(f"WebSocket: нет данных {config.WS_STALE_AFTER} сек, переподключаюсь "
+              f"({len(conn['symbols'])} символов)...")
+        try:
+            conn['ws'].exit()
+        except Exception:
+            pass
+        try:
+            self._open(conn)
+        except Exception as e:
+            print(f"WebSocket: не удалось переподключиться: {e}")
+            return
+        # За время обрыва могли закрыться свечи - догружаем их через REST
+        for symbol in conn['symbols']:
+            self._queue_for(symbol).put(('backfill', symbol, None, None))
+
+    def _on_message(self, conn, message):
+        conn['last_msg'] = time.monotonic()
+        symbol = message['topic'].rsplit('.', 1)[1]
+        for k in message['data']:
+            candle = (int(k['start']), float(k['open']), float(k['high']), float(k['low']),
+                      float(k['close']), float(k['volume']), float(k['turnover']))
+            self._queue_for(symbol).put(('kline', symbol, candle, k['confirm']))
+
+    # --- Обработка свечей ---
+
+    def _queue_for(self, symbol):
+        # Символ всегда попадает в один и тот же поток - свечи идут по порядку
+        return self.queues[zlib.crc32(symbol.encode()) % len(self.queues)]
+
+    def _worker(self, q):
+        while self.running:
+            try:
+                kind, symbol, candle, confirmed = q.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                if kind == 'backfill':
+                    self._backfill(symbol)
+                elif kind == 'kline':
+                    self._handle(symbol, candle, confirmed)
+                self._evaluate_if_new(symbol)
+            except Exception as e:
+                print(f"Ошибка обработки свечи {symbol}: {e}")
+
+    def _handle(self, symbol, candle, confirmed):
+        buffer = self.buffers[symbol]
+        if not buffer.push(candle, confirmed):
+            # Пропущены свечи - догружаем через REST и накладываем свечу заново
+            self._backfill(symbol)
+            buffer.push(candle, confirmed)
+
+    def _backfill(self, symbol):
+        self.buffers[symbol].refresh(lambda limit: self.fetch_fn(symbol, self.interval, limit),
+                                     int(self.clock() * 1000))
+
+    def _is_new(self, key, bar_ts):
+        if self.evaluated.get(key) == bar_ts:
+            return False
+        self.evaluated[key] = bar_ts
+        return True
+
+    def _evaluate_if_new(self, symbol):
+        """Проверяет сигнал ровно один раз на каждую закрытую свечу, в том числе на старших таймфреймах."""
+        buffer = self.buffers[symbol]
+        if buffer.last_ts is None or not self._is_new(symbol, buffer.last_ts):
+            return
+        if self.store is not None:
+            self.store.sync(symbol, self.interval, buffer)
+        with metrics.timer('parse'):
+            df = buffer.to_frame()
+        if not df.empty:
+            self._check(df, symbol, None)
+        if symbol in self.timeframes:
+            self.timeframes[symbol].sync(buffer)
+            for timeframe, views in get_timeframe_buffers([symbol], self._is_new, self.timeframes).items():
+                for view in views.values():
+                    with metrics.timer('parse'):
+                        df = view.to_frame()
+                    self._check(df, symbol, timeframe)
+
+    def _check(self, df, symbol, timeframe):
+        with metrics.timer('signal'):
+            entry = self.on_signal(df, symbol) if timeframe is None else self.on_signal(df, symbol, timeframe)
+        if entry and self.confluence is not None:
+            confirm_entry(self.confluence, df, symbol, timeframe or self.interval)
+
+    def _check_gaps(self):
+        """После закрытия свечи догружает символы, по которым не пришел confirm."""
+        now_ms = int(self.clock() * 1000)
+        last_closed = now_ms - now_ms % self.interval_ms - self.interval_ms
+        for symbol, buffer in self.buffers.items():
+            if buffer.last_ts is None or buffer.last_ts < last_closed:
+                self._queue_for(symbol).put(('backfill', symbol, None, None))
+
+    # --- Запуск ---
+
+    def start(self):
+        print(f"Загрузка истории для {len(self.symbols)} токенов...")
+        fetch_all(self.symbols, self._backfill, max_workers=config.MAX_WORKERS)
+
+        self.running = True
+        for q in self.queues:
+            threading.Thread(target=self._worker, args=(q,), daemon=True).start()
+        # Первая проверка по загруженной истории, как в первом проходе main()
+        for symbol in self.symbols:
+            self._queue_for(symbol).put(('evaluate', symbol, None, None))
+
+        for batch in chunks(self.symbols, config.WS_SYMBOLS_PER_CONNECTION):
+            conn = {'symbols': batch}
+            self._open(conn)
+            self.connections.append(conn)
+        print(f"Подписка оформлена: {len(self.connections)} соединений.")
+
+    def watchdog(self):
+        """Один проход контроля: зависшие соединения и пропущенные свечи."""
+        for conn in self.connections:
+            if time.monotonic() - conn['last_msg'] > config.WS_STALE_AFTER:
+                self._reconnect(conn)
+        now_ms = int(self.clock() * 1000)
+        since_close = (now_ms % self.interval_ms) / 1000
+        candle_start = now_ms - now_ms % self.interval_ms
+        if since_close >= config.WS_BACKFILL_GRACE and self.gaps_checked_for != candle_start:
+            self.gaps_checked_for = candle_start
+            self._check_gaps()
+
+    def stop(self):
+        self.running = False
+        for conn in self.connections:
+            try:
+                conn['ws'].exit()
+            except Exception:
+                pass
+
+    def run_forever(self, poll=1.0):
+        self.start()
+        try:
+            while True:
+                time.sleep(poll)
+                self.watchdog()
+        finally:
+            self.stop()
+
+
+def main():
+    print("Запуск торгового робота (WebSocket)...")
+    # Подписки не меняются на ходу - список токенов берется один раз при старте
+    universe = start_services(auto_refresh=False)
+    store = CandleStore(config.CANDLE_STORE_DIR) if config.CANDLE_STORE_DIR else None
+    KlineStream(universe.symbols(), store=store).run_forever()
+
+
+if __name__ == "__main__":
+    main()